@@ -1,18 +1,49 @@
 from __future__ import annotations
 
 from typing import List, Optional, Literal
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import asyncio
 import shutil
-import subprocess
-import sys
 
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
-from .services.logger import append_log, read_logs
+from scripts.run_all import run_all
+
+from .scripts.ingest_doc import ingest_docs
+from .services import semantic_cache
+from .services.embeddings import embed_query, get_embedding_client
+from .services.logger import append_log, get_logger, read_logs
 from .services.rag import answer_question
+from .services.vector_store import get_vector_store
+
+log = get_logger(__name__)
+
+
+# -----------------------------------------------------------
+# Paths (คำนวณครั้งเดียวตอน import)
+# -----------------------------------------------------------
+
+# โฟลเดอร์ frontend (index.html + assets)
+FRONTEND_DIR = Path(__file__).resolve().parents[1] / "frontend"
+
+# โฟลเดอร์สำหรับอัปโหลดไฟล์ PDF ใหม่
+UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+# โฟลเดอร์ผลลัพธ์ของ pipeline ฝั่ง Peng (scripts.run_all)
+INGESTED_DIR = Path("ingested")
+
+# buffer ตอน copy ไฟล์อัปโหลด (1 MiB) ลดจำนวน syscall เทียบกับ default 16KB
+UPLOAD_COPY_BUFSIZE = 1 << 20
+
+# ขนาด default executor ของ event loop (ใช้โดย asyncio.to_thread ใน RAG:
+# embed query / Chroma search / rerank) ให้รับ request พร้อมกันได้หลายตัว
+DEFAULT_EXECUTOR_WORKERS = 32
 
 
 # -----------------------------------------------------------
@@ -23,19 +54,40 @@ app = FastAPI(
     title="AI Data Ingestion Backend",
     description="Backend for DB, Embeddings, RAG, API, and Evaluation",
     version="0.1.0",
+    # serialize response ด้วย orjson (เร็วกว่า json ของ stdlib)
+    default_response_class=ORJSONResponse,
 )
 
-# เสิร์ฟไฟล์ frontend (index.html + assets) ที่ /app/
-frontend_path = Path(__file__).resolve().parents[1] / "frontend"
+# เสิร์ฟไฟล์ frontend ที่ /app/ (mount ครั้งเดียวที่นี่เท่านั้น)
 app.mount(
     "/app",
-    StaticFiles(directory=str(frontend_path), html=True),
+    StaticFiles(directory=str(FRONTEND_DIR), html=True),
     name="frontend",
 )
 
-# โฟลเดอร์สำหรับอัปโหลดไฟล์ PDF ใหม่
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+# -----------------------------------------------------------
+# Startup: pre-warm clients (auth + DNS + TLS ก่อนมี traffic จริง)
+# -----------------------------------------------------------
+
+def _warm_clients() -> None:
+    get_embedding_client()
+    embed_query("warmup")
+    get_vector_store()
+
+
+@app.on_event("startup")
+async def _warm():
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(
+            max_workers=DEFAULT_EXECUTOR_WORKERS, thread_name_prefix="rag-worker"
+        )
+    )
+    try:
+        await run_in_threadpool(_warm_clients)
+    except Exception as e:  # noqa: BLE001
+        # warm ไม่สำเร็จ (เช่น ยังไม่ได้ตั้ง GOOGLE_API_KEY) ก็ยังให้ app ขึ้นได้
+        log.warning(f"pre-warm failed: {e!r}")
 
 
 # -----------------------------------------------------------
@@ -68,9 +120,9 @@ class AskResponse(BaseModel):
     intent: str
 
 
-@app.post("/ask", response_model=AskResponse)
+@app.post("/ask", responses={200: {"model": AskResponse}})
 async def ask(req: AskRequest):
-    # 1) เรียก RAG ตอบคำถาม
+    # 1) เรียก RAG ตอบคำถาม (semantic cache อยู่ใน answer_question แล้ว)
     result = await answer_question(
         query=req.query,
         doc_ids=req.doc_ids,
@@ -92,10 +144,12 @@ async def ask(req: AskRequest):
             }
         )
     except Exception as e:  # noqa: BLE001
-        print(f"[LOG_ERROR] {e!r}")
+        log.error(f"[LOG_ERROR] {e!r}")
 
-    # 3) คืนค่าเป็น AskResponse (ตอบตรงตาม schema)
-    return AskResponse(**result)
+    # 3) คืน dict ตรง ๆ ผ่าน ORJSONResponse → ข้ามการ validate/serialize ของ response_model
+    #    result มาจาก answer_question ของเราเอง (answer/sources/intent ตาม AskResponse)
+    #    schema ยังอยู่ใน responses= ไว้ให้ OpenAPI docs
+    return ORJSONResponse(content=result)
 
 
 # -----------------------------------------------------------
@@ -117,21 +171,22 @@ def get_history(limit: int = 50):
     ดึง history Q&A ย้อนหลังใหม่สุดไม่เกิน limit รายการ
     """
     logs = read_logs(limit=limit)
-    items: List[HistoryItem] = []
-
-    for e in logs:
-        items.append(
-            HistoryItem(
-                ts=e.get("ts", ""),
-                query=e.get("query", ""),
-                answer=e.get("answer", ""),
-                doc_ids=e.get("doc_ids"),
-                intent=e.get("intent"),
-                mode=e.get("mode"),
-            )
-        )
 
-    return items
+    # คืน dict ตรง ๆ ผ่าน ORJSONResponse → ข้ามการสร้าง/validate HistoryItem ทีละตัว
+    # (response_model ยังอยู่ไว้ให้ OpenAPI docs)
+    items = [
+        {
+            "ts": e.get("ts", ""),
+            "query": e.get("query", ""),
+            "answer": e.get("answer", ""),
+            "doc_ids": e.get("doc_ids"),
+            "intent": e.get("intent"),
+            "mode": e.get("mode"),
+        }
+        for e in logs
+    ]
+
+    return ORJSONResponse(content=items)
 
 
 # -----------------------------------------------------------
@@ -149,8 +204,8 @@ async def upload_pdf(
     """
     1) รับไฟล์ PDF จากผู้ใช้
     2) เซฟลง uploads/<doc_id>.pdf
-    3) เรียก pipeline ฝั่ง Peng: scripts.run_all
-    4) เรียก backend.scripts.ingest_doc เพื่อ re-index vector DB
+    3) เรียก pipeline ฝั่ง Peng: scripts.run_all (in-process)
+    4) เรียก backend.scripts.ingest_doc.ingest_docs เพื่อ index doc นี้เข้า vector DB
     """
 
     # 0) normalize doc_type ให้มีค่าเสมอ
@@ -164,43 +219,47 @@ async def upload_pdf(
     if not doc_id.strip():
         raise HTTPException(status_code=400, detail="ต้องระบุ doc_id")
 
-    # 2) เซฟไฟล์ลง uploads/
+    # 2) เซฟไฟล์ลง uploads/ (copy ใน threadpool → ไม่บล็อก event loop)
     dest_path = UPLOAD_DIR / f"{doc_id}.pdf"
     try:
         with dest_path.open("wb") as f:
-            shutil.copyfileobj(file.file, f)
+            await run_in_threadpool(
+                shutil.copyfileobj, file.file, f, UPLOAD_COPY_BUFSIZE
+            )
     finally:
-        file.file.close()
+        await file.close()
 
-    # 3) เรียก pipeline ingestion+clean+enrich (scripts.run_all)
+    # 3) เรียก pipeline ingestion+clean+enrich (scripts.run_all) ใน process เดียวกัน
+    #    (รันใน threadpool เพราะเป็นงาน sync หนัก ๆ ไม่ให้บล็อก event loop)
     try:
-        cmd = [
-            sys.executable,
-            "-m",
-            "scripts.run_all",
-            str(dest_path),
-            "--doc-id",
-            doc_id,
-            "--doc-type",
-            doc_type,
-        ]
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:  # noqa: PERF203
+        await run_in_threadpool(
+            run_all,
+            pdf_path=dest_path,
+            doc_id=doc_id,
+            doc_type=doc_type,
+            output_root=INGESTED_DIR,
+        )
+    except Exception as e:  # noqa: BLE001
         raise HTTPException(
             status_code=500,
             detail=f"run_all pipeline error: {e}",
         ) from e
 
-    # 4) re-index vector DB (backend.scripts.ingest_doc จะ scan โฟลเดอร์ ingested)
+    # 4) index เฉพาะ doc ที่เพิ่งอัปโหลดเข้า vector DB (Chroma upsert ตาม chunk id)
     try:
-        cmd = [sys.executable, "-m", "backend.scripts.ingest_doc"]
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:  # noqa: PERF203
+        await run_in_threadpool(
+            ingest_docs,
+            [(doc_id, str(INGESTED_DIR / doc_id))],
+        )
+    except Exception as e:  # noqa: BLE001
         raise HTTPException(
             status_code=500,
             detail=f"re-index error (ingest_doc): {e}",
         ) from e
 
+    # มีเอกสารใหม่แล้ว → คำตอบที่ cache ไว้อาจไม่ครบ
+    semantic_cache.clear()
+
     return {"ok": True, "doc_id": doc_id, "doc_type": doc_type}
 
 
@@ -26,7 +26,8 @@ class TextItem(BaseModel):
     }
     """
 
-    model_config = ConfigDict(extra="allow")  # เผื่อ Peng ใส่ field อื่นเพิ่ม
+    # frozen: สร้างครั้งเดียวจาก loader แล้วอ่านอย่างเดียว
+    model_config = ConfigDict(extra="allow", frozen=True)  # เผื่อ Peng ใส่ field อื่นเพิ่ม
 
     id: str
     doc_id: str
@@ -62,7 +63,7 @@ class TableItem(BaseModel):
     }
     """
 
-    model_config = ConfigDict(extra="allow")
+    model_config = ConfigDict(extra="allow", frozen=True)
 
     id: str
     doc_id: str
@@ -94,7 +95,7 @@ class ImageItem(BaseModel):
     }
     """
 
-    model_config = ConfigDict(extra="allow")
+    model_config = ConfigDict(extra="allow", frozen=True)
 
     id: str
     doc_id: str
@@ -164,3 +165,8 @@ class DocumentBundle(BaseModel):
     texts: List[TextItem] = Field(default_factory=list)
     tables: List[TableItem] = Field(default_factory=list)
     images: List[ImageItem] = Field(default_factory=list)
+
+
+# build validator ให้เสร็จตั้งแต่ตอน import (ไม่ไปจ่ายตอนโหลดเอกสารแรก)
+for _model in (TextItem, TableItem, ImageItem, Metadata, DocumentBundle):
+    _model.model_rebuild(force=True)
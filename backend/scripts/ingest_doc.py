@@ -2,16 +2,25 @@
 
 from __future__ import annotations
 
+import argparse
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 from backend.services.loader import load_document_bundle
 from backend.services.chunking import (
-    image_items_to_chunks,
-    table_items_to_chunks,
-    text_items_to_chunks,
+    Chunk,
+    build_all_chunks,
+    dedup_by_content,
 )
+from backend.services.embeddings import embed_texts
+from backend.services.logger import get_logger
 from backend.services.vector_store import index_chunks, search_similar
 
+log = get_logger(__name__)
+
 
 # -------------------------------------------------------------------
 # CONFIG
@@ -40,7 +49,7 @@ def discover_docs_from_ingested(root: str = "ingested") -> list[tuple[str, str]]
     """
     base = Path(root)
     if not base.exists():
-        print(f"[WARN] โฟลเดอร์ '{root}' ยังไม่มี (ให้ฝั่ง Peng รัน ingestion ก่อน)")
+        log.warning(f"โฟลเดอร์ '{root}' ยังไม่มี (ให้ฝั่ง Peng รัน ingestion ก่อน)")
         return []
 
     docs: list[tuple[str, str]] = []
@@ -56,13 +65,13 @@ def get_docs_to_ingest() -> list[tuple[str, str]]:
     เลือกว่าจะใช้ DOCS แบบ fix เอง หรือ auto-discover จาก ingested/
     """
     if DOCS:
-        print("[INFO] ใช้รายการ DOCS ที่กำหนดไว้ในสคริปต์")
+        log.info("ใช้รายการ DOCS ที่กำหนดไว้ในสคริปต์")
         return DOCS
 
-    print("[INFO] ไม่ได้กำหนด DOCS เอง -> scan จากโฟลเดอร์ 'ingested/'")
+    log.info("ไม่ได้กำหนด DOCS เอง -> scan จากโฟลเดอร์ 'ingested/'")
     docs = discover_docs_from_ingested("ingested")
     if not docs:
-        print("[ERROR] ไม่พบเอกสารใน 'ingested/' เลย")
+        log.error("ไม่พบเอกสารใน 'ingested/' เลย")
     return docs
 
 
@@ -87,7 +96,7 @@ def check_ingested_folder(base_dir: str, doc_id: str) -> bool:
 
     meta_path = base_path / "metadata.json"
     if not meta_path.exists():
-        print(f"[WARN] skip doc_id={doc_id}: ไม่มี metadata.json ใน {base_dir}")
+        log.warning(f"skip doc_id={doc_id}: ไม่มี metadata.json ใน {base_dir}")
         return False
 
     text_candidates = [
@@ -96,8 +105,8 @@ def check_ingested_folder(base_dir: str, doc_id: str) -> bool:
         base_path / "text.json",
     ]
     if not any(p.exists() for p in text_candidates):
-        print(
-            f"[WARN] skip doc_id={doc_id}: "
+        log.warning(
+            f"skip doc_id={doc_id}: "
             f"ไม่พบ text_enriched.json / text_clean.json / text.json ใน {base_dir}"
         )
         return False
@@ -108,88 +117,165 @@ def check_ingested_folder(base_dir: str, doc_id: str) -> bool:
         base_path / "table.json",
     ]
     if not any(p.exists() for p in table_candidates):
-        print(
-            f"[WARN] skip doc_id={doc_id}: "
+        log.warning(
+            f"skip doc_id={doc_id}: "
             f"ไม่พบ table_normalized.json / table_clean.json / table.json ใน {base_dir}"
         )
         return False
 
     image_path = base_path / "image.json"
     if not image_path.exists():
-        print(f"[WARN] skip doc_id={doc_id}: ไม่มี image.json ใน {base_dir}")
+        log.warning(f"skip doc_id={doc_id}: ไม่มี image.json ใน {base_dir}")
         return False
 
     return True
 
 
 # -------------------------------------------------------------------
-# main
+# process 1 doc: โหลด → แปลงเป็น chunks (รันขนานกันได้ทีละหลาย doc)
 # -------------------------------------------------------------------
-def main():
-    docs_to_ingest = get_docs_to_ingest()
-    if not docs_to_ingest:
-        print("=== Ingestion: ไม่มีเอกสารให้ ingest ===")
-        return
+def process_doc(doc_id: str, base_dir: str) -> list[Chunk]:
+    """
+    โหลดเอกสาร 1 ชุดแล้วแปลงเป็น chunks
+    ถ้าโฟลเดอร์ไม่ครบ / โหลดไม่ได้ → คืน [] (caller จะข้าม doc นี้)
+    """
+    log.info(f"[DOC] {doc_id} from {base_dir}")
 
-    all_chunks = []
-    ingested_doc_ids: list[str] = []
+    # 1) pre-check โฟลเดอร์ว่ามีไฟล์พอใช้ไหม
+    if not check_ingested_folder(base_dir, doc_id):
+        # ถ้าไม่ครบ → ข้าม doc นี้ไป
+        return []
+
+    # 2) ลองโหลด DocumentBundle
+    try:
+        bundle = load_document_bundle(base_dir, doc_id)
+    except FileNotFoundError as e:
+        log.error(f"skip doc_id={doc_id}: file not found -> {e}")
+        return []
+    except ValueError as e:
+        # เช่น metadata.doc_id != doc_id แล้วคุณอยาก skip ไปเลย
+        log.error(f"skip doc_id={doc_id}: value error -> {e}")
+        return []
+    except Exception as e:
+        log.error(f"skip doc_id={doc_id}: unexpected error -> {e}")
+        return []
 
-    print("=== Ingestion: start ===")
-    for doc_id, base_dir in docs_to_ingest:
-        print(f"\n[DOC] {doc_id} from {base_dir}")
+    # 3) แปลงเป็น chunks (text + table + image รวดเดียว)
+    doc_chunks = build_all_chunks(bundle)
 
-        # 1) pre-check โฟลเดอร์ว่ามีไฟล์พอใช้ไหม
-        if not check_ingested_folder(base_dir, doc_id):
-            # ถ้าไม่ครบ → ข้าม doc นี้ไป
-            continue
+    counts = Counter(c.source for c in doc_chunks)
+    log.info(
+        f"  [{doc_id}] text chunks : {counts['text']}\n"
+        f"  [{doc_id}] table chunks: {counts['table']}\n"
+        f"  [{doc_id}] image chunks: {counts['image']}\n"
+        f"  [{doc_id}] total chunks: {len(doc_chunks)}"
+    )
 
-        # 2) ลองโหลด DocumentBundle
-        try:
-            bundle = load_document_bundle(base_dir, doc_id)
-        except FileNotFoundError as e:
-            print(f"[ERROR] skip doc_id={doc_id}: file not found -> {e}")
-            continue
-        except ValueError as e:
-            # เช่น metadata.doc_id != doc_id แล้วคุณอยาก skip ไปเลย
-            print(f"[ERROR] skip doc_id={doc_id}: value error -> {e}")
-            continue
-        except Exception as e:
-            print(f"[ERROR] skip doc_id={doc_id}: unexpected error -> {e}")
-            continue
+    return doc_chunks
+
+
+# -------------------------------------------------------------------
+# ingest หลาย doc: load + chunk (ขนาน) → index_chunks ทีเดียว
+# -------------------------------------------------------------------
+def ingest_docs(
+    docs: list[tuple[str, str]],
+    workers: int | None = None,
+) -> list[str]:
+    """
+    ingest เอกสารตามรายการ (doc_id, base_dir) เข้า Chroma
+    คืน list ของ doc_id ที่ index สำเร็จ
 
-        # 3) แปลงเป็น chunks
-        text_chunks = text_items_to_chunks(bundle)
-        table_chunks = table_items_to_chunks(bundle)
-        image_chunks = image_items_to_chunks(bundle)
+    ใช้ได้ทั้งจาก main() (CLI) และเรียกตรง ๆ ใน process ของ backend (/upload)
+    """
+    all_chunks: list[Chunk] = []
+    ingested_doc_ids: list[str] = []
 
-        doc_chunks = text_chunks + table_chunks + image_chunks
+    if not docs:
+        return ingested_doc_ids
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(docs)))
 
-        print(f"  text chunks : {len(text_chunks)}")
-        print(f"  table chunks: {len(table_chunks)}")
-        print(f"  image chunks: {len(image_chunks)}")
-        print(f"  total chunks: {len(doc_chunks)}")
+    log.info(f"=== Ingestion: start (workers={workers}) ===")
 
+    def _collect(doc_id: str, doc_chunks: list[Chunk]) -> None:
         if doc_chunks:
             all_chunks.extend(doc_chunks)
             ingested_doc_ids.append(doc_id)
         else:
-            print(f"[WARN] doc_id={doc_id} ไม่มี chunks เลย → ข้ามจากการ index")
+            log.warning(f"doc_id={doc_id} ไม่มี chunks เลย → ข้ามจากการ index")
+
+    if workers == 1:
+        # doc เดียว (เช่น /upload) → ทำใน thread นี้เลย ไม่ต้อง fork ทั้ง server ที่มี thread อื่นวิ่งอยู่
+        for doc_id, base_dir in docs:
+            try:
+                doc_chunks = process_doc(doc_id, base_dir)
+            except Exception as e:
+                log.error(f"skip doc_id={doc_id}: worker error -> {e}")
+                continue
+            _collect(doc_id, doc_chunks)
+    else:
+        # โหลด + chunk แต่ละ doc ขนานกัน ส่วน index_chunks ทำทีเดียวตอนท้าย
+        # ใช้ spawn → process ลูกเริ่มใหม่สะอาด ไม่ fork thread / lock ที่ค้างอยู่ใน process แม่
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            futures = {
+                pool.submit(process_doc, doc_id, base_dir): doc_id
+                for doc_id, base_dir in docs
+            }
+            for future in as_completed(futures):
+                doc_id = futures[future]
+                try:
+                    doc_chunks = future.result()
+                except Exception as e:
+                    log.error(f"skip doc_id={doc_id}: worker error -> {e}")
+                    continue
+                _collect(doc_id, doc_chunks)
 
     if not all_chunks:
-        print("\n[SUMMARY] ไม่มี chunks จากเอกสารไหนเลย → ไม่เรียก index_chunks")
-        print("=== Ingestion: done (no data) ===")
-        return
+        log.info("[SUMMARY] ไม่มี chunks จากเอกสารไหนเลย → ไม่เรียก index_chunks")
+        return ingested_doc_ids
+
+    log.info(f"[SUMMARY] total chunks from all docs: {len(all_chunks)}")
 
-    print(f"\n[SUMMARY] total chunks from all docs: {len(all_chunks)}")
+    # 4) embed เฉพาะ content ที่ไม่ซ้ำกัน แล้วให้ chunk ที่ซ้ำใช้ vector ร่วมกัน
+    unique_contents = dedup_by_content(all_chunks)
+    log.info(
+        f"[SUMMARY] unique contents: {len(unique_contents)} "
+        f"(duplicates: {len(all_chunks) - len(unique_contents)})"
+    )
+    vectors = embed_texts(list(unique_contents.values()))
+    vectors_by_hash = dict(zip(unique_contents.keys(), vectors))
+
+    # 5) index chunks ทั้งหมดเข้า Chroma
+    #    persist ครั้งเดียวตอนจบงาน (Chroma >= 0.4 auto-persist อยู่แล้ว)
+    index_chunks(all_chunks, vectors_by_hash=vectors_by_hash, flush=True)
+    log.info("Indexed all chunks into Chroma.")
+
+    return ingested_doc_ids
+
+
+# -------------------------------------------------------------------
+# main
+# -------------------------------------------------------------------
+def main(
+    docs: list[tuple[str, str]] | None = None,
+    workers: int | None = None,
+):
+    docs_to_ingest = docs if docs is not None else get_docs_to_ingest()
+    if not docs_to_ingest:
+        log.info("=== Ingestion: ไม่มีเอกสารให้ ingest ===")
+        return
 
-    # 4) index chunks ทั้งหมดเข้า Chroma
-    index_chunks(all_chunks)
-    print("\nIndexed all chunks into Chroma.")
+    ingested_doc_ids = ingest_docs(docs_to_ingest, workers=workers)
 
-    # 5) ทดลอง search เบื้องต้น (ถ้ามี doc_id ที่ ingest สำเร็จ)
+    # 6) ทดลอง search เบื้องต้น (ถ้ามี doc_id ที่ ingest สำเร็จ)
     if not ingested_doc_ids:
-        print("\n[INFO] ไม่มี doc ไหน ingest สำเร็จ → ข้าม test search")
-        print("\n=== Ingestion: done ===")
+        log.info("ไม่มี doc ไหน ingest สำเร็จ → ข้าม test search")
+        log.info("=== Ingestion: done ===")
         return
 
     # พยายามหา doc_001 / doc_002 ใน list ถ้ามีก็ใช้
@@ -205,22 +291,28 @@ def main():
         test_queries.append(("ยอดคงเหลือรวมสิ้นงวด", [ingested_doc_ids[0]]))
 
     for query, doc_ids in test_queries:
-        print("\n" + "=" * 60)
-        print(f"Test search with query: {query!r} (doc_ids={doc_ids})")
+        log.info(f"[TEST] search with query: {query!r} (doc_ids={doc_ids})")
 
         docs = search_similar(query=query, k=3, doc_ids=doc_ids)
 
         if not docs:
-            print("  -> No results")
+            log.info("[TEST] -> No results")
             continue
 
         for i, doc in enumerate(docs, start=1):
-            print(f"\nResult #{i}")
-            print("  content :", doc.page_content)
-            print("  metadata:", doc.metadata)
+            log.info(f"[TEST] Result #{i}\n  content : {doc.page_content}\n  metadata: {doc.metadata}")
 
-    print("\n=== Ingestion: done ===")
+    log.info("=== Ingestion: done ===")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Index ingested documents into Chroma.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="จำนวน process ที่ใช้โหลด/chunk เอกสารพร้อมกัน (default: os.cpu_count())",
+    )
+    args = parser.parse_args()
+
+    main(workers=args.workers)
@@ -1,15 +1,17 @@
 from __future__ import annotations
 
+import hashlib
+from dataclasses import dataclass, field
 from typing import Any, Dict, List, Literal, Optional
 
-from pydantic import BaseModel
-
 from ..models import DocumentBundle, TableItem
 
 
-class Chunk(BaseModel):
+@dataclass(slots=True, kw_only=True)
+class Chunk:
     """
     หนึ่งชิ้นข้อมูลที่เราจะส่งเข้า Vector DB
+    (ใช้ dataclass ธรรมดา: สร้างจากข้อมูลที่ validate แล้วใน loader → ไม่ต้อง validate ซ้ำ)
     """
 
     id: str          # ต้อง unique ทั่วทุก doc
@@ -18,21 +20,40 @@ class Chunk(BaseModel):
     source: Literal["text", "table", "image"]
     page: Optional[int] = None
     content: str
-    metadata: Dict[str, Any] = {}
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+def content_hash(text: str) -> str:
+    """
+    hash ของเนื้อหา chunk (ใช้ dedup ก่อน embed)
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def dedup_by_content(chunks: List[Chunk]) -> Dict[str, str]:
+    """
+    รวม chunk ที่ content ซ้ำกันเป็นตัวเดียว
+    คืน dict: content_hash -> content (เรียงตามลำดับที่เจอครั้งแรก)
+    """
+    unique: Dict[str, str] = {}
+    for c in chunks:
+        unique.setdefault(content_hash(c.content), c.content)
+    return unique
 
 
 def _table_to_text(table: TableItem) -> str:
-    header = f"Table {table.name} (page {table.page})"
-    col_line = " | ".join(table.columns)
-    row_lines = []
+    # เอาแค่ 10 แถวแรกพอ (slice เกินความยาว list ได้ ไม่ต้องเช็ค min)
+    body = "\n".join(" | ".join(row) for row in table.rows[:10])
+    return (
+        f"Table {table.name} (page {table.page})\n"
+        f"Columns: {' | '.join(table.columns)}\n"
+        f"Rows:\n{body}"
+    )
 
-    max_rows = min(len(table.rows), 10)
-    for row in table.rows[:max_rows]:
-        row_lines.append(" | ".join(row))
 
-    body = "\n".join(row_lines)
-    text = f"{header}\nColumns: {col_line}\nRows:\n{body}"
-    return text
+def _doc_type_of(item: Any) -> str:
+    # doc_type ใน models เป็น Optional → None ห้ามหลุดเข้า metadata ของ Chroma / filter
+    return item.doc_type or "unknown"
 
 
 def text_items_to_chunks(bundle: DocumentBundle) -> List[Chunk]:
@@ -41,11 +62,12 @@ def text_items_to_chunks(bundle: DocumentBundle) -> List[Chunk]:
     for item in bundle.texts:
         if not item.content:
             continue
+        doc_type = _doc_type_of(item)
 
         chunk = Chunk(
             id=f"{item.doc_id}::text::{item.id}",   # <<< ใส่ doc_id เข้าไป
             doc_id=item.doc_id,
-            doc_type=item.doc_type,
+            doc_type=doc_type,
             source="text",
             page=item.page,
             content=item.content,
@@ -54,7 +76,7 @@ def text_items_to_chunks(bundle: DocumentBundle) -> List[Chunk]:
                 "section": item.section,
                 "bbox": item.bbox,
                 "page": item.page,
-                "doc_type": item.doc_type,
+                "doc_type": doc_type,
             },
         )
         chunks.append(chunk)
@@ -67,11 +89,12 @@ def table_items_to_chunks(bundle: DocumentBundle) -> List[Chunk]:
 
     for item in bundle.tables:
         text_representation = _table_to_text(item)
+        doc_type = _doc_type_of(item)
 
         chunk = Chunk(
             id=f"{item.doc_id}::table::{item.id}",  # <<< ใส่ doc_id เข้าไป
             doc_id=item.doc_id,
-            doc_type=item.doc_type,
+            doc_type=doc_type,
             source="table",
             page=item.page,
             content=text_representation,
@@ -81,7 +104,7 @@ def table_items_to_chunks(bundle: DocumentBundle) -> List[Chunk]:
                 "columns": item.columns,
                 "bbox": item.bbox,
                 "page": item.page,
-                "doc_type": item.doc_type,
+                "doc_type": doc_type,
             },
         )
         chunks.append(chunk)
@@ -95,11 +118,12 @@ def image_items_to_chunks(bundle: DocumentBundle) -> List[Chunk]:
     for item in bundle.images:
         if not item.caption:
             continue
+        doc_type = _doc_type_of(item)
 
         chunk = Chunk(
             id=f"{item.doc_id}::image::{item.id}",  # <<< ใส่ doc_id เข้าไป
             doc_id=item.doc_id,
-            doc_type=item.doc_type,
+            doc_type=doc_type,
             source="image",
             page=item.page,
             content=item.caption,
@@ -108,9 +132,21 @@ def image_items_to_chunks(bundle: DocumentBundle) -> List[Chunk]:
                 "file_path": item.file_path,
                 "bbox": item.bbox,
                 "page": item.page,
-                "doc_type": item.doc_type,
+                "doc_type": doc_type,
             },
         )
         chunks.append(chunk)
 
     return chunks
+
+
+def build_all_chunks(bundle: DocumentBundle) -> List[Chunk]:
+    """
+    รวม chunks ทุกประเภท (text + table + image) ของเอกสารเดียวใน list เดียว
+    → caller เอาไป embed รวดเดียว ไม่ต้องแยก batch ตามประเภท
+    """
+    return (
+        text_items_to_chunks(bundle)
+        + table_items_to_chunks(bundle)
+        + image_items_to_chunks(bundle)
+    )
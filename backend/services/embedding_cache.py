@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# โฟลเดอร์เก็บ cache = <root>/cache/embeddings.sqlite (แบบเดียวกับ logs/)
+ROOT_DIR = Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT_DIR / "cache"
+CACHE_FILE = CACHE_DIR / "embeddings.sqlite"
+
+# เก็บ vector แบบ int8 (symmetric, scale ต่อ vector) → เล็กกว่า float32 4 เท่า
+# cosine similarity ของ vector ที่ถอดกลับแทบไม่เปลี่ยน (error ~1e-4)
+_TABLE = "embeddings_q8"
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+
+def make_key(model_name: str, text: str) -> bytes:
+    """
+    สร้าง key ของ cache จาก sha256(model_name + "\\0" + text)
+    ใส่ชื่อโมเดลไว้ด้วย → เปลี่ยนโมเดลแล้วไม่หยิบ vector เก่าผิด ๆ มาใช้
+    """
+    return hashlib.sha256((model_name + "\x00" + text).encode("utf-8")).digest()
+
+
+def _get_conn() -> sqlite3.Connection:
+    """
+    เปิด SQLite ครั้งเดียวต่อ process แล้วใช้ซ้ำ
+    """
+    global _conn
+    if _conn is None:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(CACHE_FILE), check_same_thread=False)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {_TABLE} ("
+            "hash BLOB PRIMARY KEY, model TEXT, vec BLOB, scale REAL)"
+        )
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def quantize_int8(vec: Sequence[float]) -> Tuple[np.ndarray, float]:
+    """
+    แปลง vector float → int8 แบบ symmetric: vec ≈ q * scale
+    """
+    arr = np.asarray(vec, dtype=np.float32)
+    max_abs = float(np.max(np.abs(arr))) if arr.size else 0.0
+    scale = max_abs / 127.0 if max_abs > 0 else 1.0
+    q = np.clip(np.rint(arr / scale), -127, 127).astype(np.int8)
+    return q, scale
+
+
+def dequantize_int8(q: np.ndarray, scale: float) -> np.ndarray:
+    return q.astype(np.float32) * np.float32(scale)
+
+
+def roundtrip_int8(vec: Sequence[float]) -> List[float]:
+    """
+    quantize → dequantize ทันที ให้ได้ค่าเดียวกับที่จะอ่านกลับจาก cache
+    (vector ที่เพิ่ง embed กับที่มาจาก cache จะเป็นค่าเดียวกันเป๊ะ)
+    """
+    return dequantize_int8(*quantize_int8(vec)).tolist()
+
+
+def _decode(blob: bytes, scale: float) -> List[float]:
+    return dequantize_int8(np.frombuffer(blob, dtype=np.int8), scale).tolist()
+
+
+def _encode(vec: Sequence[float]) -> Tuple[bytes, float]:
+    q, scale = quantize_int8(vec)
+    return q.tobytes(), scale
+
+
+def get(key: bytes) -> Optional[List[float]]:
+    """
+    ดึง vector จาก cache ตาม key (ไม่มี → None)
+    """
+    with _lock:
+        row = _get_conn().execute(
+            f"SELECT vec, scale FROM {_TABLE} WHERE hash = ?", (key,)
+        ).fetchone()
+    if row is None:
+        return None
+    return _decode(row[0], row[1])
+
+
+def get_many(keys: Iterable[bytes]) -> Dict[bytes, List[float]]:
+    """
+    ดึงหลาย key ในครั้งเดียว คืนเฉพาะตัวที่เจอ (key -> vector)
+    """
+    unique_keys = list(dict.fromkeys(keys))
+    found: Dict[bytes, List[float]] = {}
+
+    # SQLite จำกัดจำนวน parameter ต่อ statement → แบ่งเป็นก้อน ๆ
+    step = 500
+    with _lock:
+        conn = _get_conn()
+        for start in range(0, len(unique_keys), step):
+            part = unique_keys[start : start + step]
+            placeholders = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT hash, vec, scale FROM {_TABLE} WHERE hash IN ({placeholders})",
+                part,
+            ).fetchall()
+            for h, blob, scale in rows:
+                found[bytes(h)] = _decode(blob, scale)
+
+    return found
+
+
+def put_many(items: Iterable[Tuple[bytes, str, Sequence[float]]]) -> None:
+    """
+    เขียน (key, model_name, vector) หลายตัวลง cache ใน transaction เดียว
+    """
+    rows = [(key, model, *_encode(vec)) for key, model, vec in items]
+    if not rows:
+        return
+
+    with _lock:
+        conn = _get_conn()
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {_TABLE} (hash, model, vec, scale) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
@@ -1,24 +1,73 @@
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import List
+import threading
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
-from dotenv import load_dotenv
+from cachetools import TTLCache
+from langchain_core.embeddings import Embeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
+from ingestion.config import GOOGLE_API_KEY
+
+from . import embedding_cache
+
+try:
+    import uvloop
+except ImportError:  # Windows / ไม่ได้ลง uvicorn[standard]
+    uvloop = None
+
 
 _EMBEDDING_MODEL_NAME = "models/text-embedding-004"
 
+# L1 cache ของ query embedding ในหน่วยความจำ
+# - จำกัดขนาด (LRU) และอายุ (TTL) กันข้อมูลค้างนานเกินไป
+QUERY_CACHE_MAXSIZE = 4096
+QUERY_CACHE_TTL = 600  # วินาที
+
+_query_cache: TTLCache = TTLCache(maxsize=QUERY_CACHE_MAXSIZE, ttl=QUERY_CACHE_TTL)
+_query_cache_lock = threading.Lock()
+
+# event loop ถาวร 1 ตัว (thread แยก) สำหรับงาน embed แบบ async
+# - client ถูก cache ไว้ → channel (gRPC / HTTP/2) ผูกกับ loop เดียวตลอด ไม่ต้อง handshake ใหม่
+# - ใช้ uvloop ถ้ามี
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _reset_loop_after_fork() -> None:
+    # thread ของ loop ไม่ตามไปใน process ลูก → ให้สร้างใหม่เมื่อจำเป็น
+    global _loop, _loop_lock
+    _loop = None
+    _loop_lock = threading.Lock()
 
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_loop_after_fork)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="embedding-loop", daemon=True
+            ).start()
+            _loop = loop
+    return _loop
+
+
+@lru_cache(maxsize=1)
 def get_embedding_client() -> GoogleGenerativeAIEmbeddings:
     """
-    เตรียม client สำหรับสร้าง embedding ด้วย Gemini
+    เตรียม client สำหรับสร้าง embedding ด้วย Gemini (สร้างครั้งเดียวแล้วใช้ซ้ำ)
     ต้องมี GOOGLE_API_KEY อยู่ใน .env หรือ environment
     """
-    load_dotenv()
-
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    # .env ถูกโหลดครั้งเดียวใน ingestion.config แล้ว
+    if not GOOGLE_API_KEY:
         # ให้ error ชัด ๆ เผื่อลืมตั้งค่า
         raise RuntimeError(
             "GOOGLE_API_KEY is not set. Please add it to your environment or .env file."
@@ -31,10 +80,133 @@ def get_embedding_client() -> GoogleGenerativeAIEmbeddings:
     return embeddings
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
+EMBED_BATCH_SIZE = 100
+EMBED_CONCURRENCY = 16
+
+
+async def _aembed_in_batches(
+    texts: List[str],
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+) -> List[List[float]]:
     """
-    helper embed เป็น batch
+    embed แบบแบ่ง micro-batch แล้วยิงพร้อมกัน (จำกัดด้วย semaphore)
+    - เรียงตามความยาวก่อน ให้แต่ละ batch มีขนาดใกล้ ๆ กัน
+    - ได้ผลแล้วเอากลับไปใส่ตามลำดับเดิม
     """
     embeddings = get_embedding_client()
-    vectors = embeddings.embed_documents(texts)
+
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches = [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run(batch: List[int]) -> List[List[float]]:
+        async with semaphore:
+            return await embeddings.aembed_documents([texts[i] for i in batch])
+
+    results = await asyncio.gather(*(_run(b) for b in batches))
+
+    vectors: List[List[float]] = [[] for _ in texts]
+    for batch, batch_vectors in zip(batches, results):
+        for i, vec in zip(batch, batch_vectors):
+            vectors[i] = vec
     return vectors
+
+
+async def aembed_texts(
+    texts: List[str],
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+) -> List[List[float]]:
+    """
+    helper embed เป็น batch (async)
+    - เช็ค cache บนดิสก์ก่อน (key = sha256(model + "\\0" + text))
+    - ยิง API เฉพาะข้อความที่ยังไม่เคย embed (แบ่ง batch ยิงพร้อมกัน)
+    - คืนผลตามลำดับเดิมของ texts
+    """
+    if not texts:
+        return []
+
+    keys = [embedding_cache.make_key(_EMBEDDING_MODEL_NAME, t) for t in texts]
+    vectors_by_key = embedding_cache.get_many(keys)
+
+    # รวมข้อความที่ซ้ำกันให้ยิง API แค่ครั้งเดียว
+    misses: dict[bytes, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors_by_key and key not in misses:
+            misses[key] = text
+
+    if misses:
+        new_vectors = await _aembed_in_batches(
+            list(misses.values()),
+            batch_size=batch_size,
+            concurrency=concurrency,
+        )
+        # ใช้ค่าที่ผ่าน int8 แล้ว → vector ที่ลง Chroma ตรงกับที่อ่านจาก cache
+        # ไม่ว่า cache จะอุ่นหรือเย็น (index ซ้ำได้ผลเหมือนเดิม)
+        new_items = [
+            (key, embedding_cache.roundtrip_int8(vec))
+            for key, vec in zip(misses.keys(), new_vectors)
+        ]
+
+        embedding_cache.put_many(
+            (key, _EMBEDDING_MODEL_NAME, vec) for key, vec in new_items
+        )
+        vectors_by_key.update(new_items)
+
+    return [list(vectors_by_key[key]) for key in keys]
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    helper embed เป็น batch (sync wrapper ของ aembed_texts)
+    รันบน embedding loop ถาวร → เรียกได้ทั้งจากโค้ด sync และจากใน event loop อื่น
+    """
+    future = asyncio.run_coroutine_threadsafe(aembed_texts(texts), _get_loop())
+    return future.result()
+
+
+def _embed_query_uncached(text: str) -> Tuple[float, ...]:
+    # query ใช้ task_type คนละแบบกับ document → แยก key ไม่ให้ชนกัน
+    key = embedding_cache.make_key(_EMBEDDING_MODEL_NAME + "\x00query", text)
+
+    vec = embedding_cache.get(key)
+    if vec is None:
+        vec = embedding_cache.roundtrip_int8(get_embedding_client().embed_query(text))
+        embedding_cache.put_many([(key, _EMBEDDING_MODEL_NAME, vec)])
+
+    return tuple(vec)
+
+
+def embed_query(text: str) -> List[float]:
+    """
+    embed คำถาม 1 ข้อความ
+    - L1: LRU + TTL ในหน่วยความจำ (key = (model, text.strip()))
+    - L2: cache บนดิสก์ (SQLite) ตัวเดียวกับ embed_texts
+    """
+    text = text.strip()
+    cache_key = (_EMBEDDING_MODEL_NAME, text)
+
+    with _query_cache_lock:
+        cached = _query_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
+
+    vec = _embed_query_uncached(text)
+
+    with _query_cache_lock:
+        _query_cache[cache_key] = vec
+    return list(vec)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    ตัวห่อ embeddings ให้ Chroma เรียกผ่าน embed_texts / embed_query ที่มี cache
+    (Chroma จะเรียก embed_documents ตอน add_texts และ embed_query ตอน search)
+    """
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return embed_texts(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return embed_query(text)
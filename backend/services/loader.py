@@ -1,8 +1,11 @@
 from __future__ import annotations
 
-import json
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
+
+import orjson
+from pydantic import TypeAdapter
 
 from ..models import (
     DocumentBundle,
@@ -13,14 +16,31 @@ from ..models import (
 )
 
 
+# validate ทั้ง list ทีเดียวด้วย adapter ที่ build ไว้ครั้งเดียวตอน import
+_TEXTS_ADAPTER = TypeAdapter(List[TextItem])
+_TABLES_ADAPTER = TypeAdapter(List[TableItem])
+_IMAGES_ADAPTER = TypeAdapter(List[ImageItem])
+
+# ไฟล์ทั้งหมดที่ loader อาจอ่าน (ใช้ทำ signature ของโฟลเดอร์สำหรับ cache)
+_BUNDLE_FILES = (
+    "metadata.json",
+    "text_enriched.json",
+    "text_clean.json",
+    "text.json",
+    "table_normalized.json",
+    "table_clean.json",
+    "table.json",
+    "image.json",
+)
+
+
 def _load_json(path: Path):
     """
     helper เล็ก ๆ โหลด JSON จากไฟล์ (ถ้าไฟล์ไม่มีจะ raise error)
     """
     if not path.exists():
         raise FileNotFoundError(f"JSON file not found: {path}")
-    text = path.read_text(encoding="utf-8")
-    return json.loads(text)
+    return orjson.loads(path.read_bytes())
 
 
 def _load_json_if_exists(path: Path):
@@ -31,11 +51,42 @@ def _load_json_if_exists(path: Path):
     """
     if not path.exists():
         return None
-    text = path.read_text(encoding="utf-8")
-    return json.loads(text)
+    return orjson.loads(path.read_bytes())
+
+
+def _folder_signature(base_path: Path) -> Tuple[Tuple[str, int, int], ...]:
+    """
+    (ชื่อไฟล์, mtime_ns, size) ของไฟล์ที่มีอยู่ → ถ้าไฟล์ไหนเปลี่ยน signature จะเปลี่ยนตาม
+    """
+    sig = []
+    for name in _BUNDLE_FILES:
+        try:
+            st = (base_path / name).stat()
+        except FileNotFoundError:
+            continue
+        sig.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
 
 
 def load_document_bundle(base_dir: str, doc_id: str) -> DocumentBundle:
+    """
+    โหลด DocumentBundle ของ doc_id เดียว (มี cache ในหน่วยความจำ)
+
+    ถ้าไฟล์ในโฟลเดอร์ไม่เปลี่ยน (mtime + size เท่าเดิม) จะคืน bundle เดิมทันที
+    ไม่ต้องอ่าน/parse/validate JSON ใหม่ (item model เป็น frozen แชร์กันได้)
+    """
+    base_path = Path(base_dir)
+    return _load_document_bundle_cached(
+        str(base_path.resolve()), doc_id, _folder_signature(base_path)
+    )
+
+
+@lru_cache(maxsize=32)
+def _load_document_bundle_cached(
+    base_dir: str,
+    doc_id: str,
+    signature: Tuple[Tuple[str, int, int], ...],
+) -> DocumentBundle:
     """
     โหลดข้อมูลของเอกสาร 1 ชุด (doc_id เดียว) จากโฟลเดอร์ที่มีไฟล์จากฝั่ง Peng
 
@@ -99,7 +150,7 @@ def load_document_bundle(base_dir: str, doc_id: str) -> DocumentBundle:
         item.setdefault("doc_id", metadata.doc_id)
         item.setdefault("doc_type", metadata.doc_type)
 
-    texts: List[TextItem] = [TextItem(**item) for item in text_list_raw]
+    texts: List[TextItem] = _TEXTS_ADAPTER.validate_python(text_list_raw)
 
     # ----------------------------------------------------
     # 3) เลือก source สำหรับ TABLE
@@ -127,7 +178,7 @@ def load_document_bundle(base_dir: str, doc_id: str) -> DocumentBundle:
         item.setdefault("doc_id", metadata.doc_id)
         item.setdefault("doc_type", metadata.doc_type)
 
-    tables: List[TableItem] = [TableItem(**item) for item in table_list_raw]
+    tables: List[TableItem] = _TABLES_ADAPTER.validate_python(table_list_raw)
 
     # ----------------------------------------------------
     # 4) IMAGE – ตอนนี้ใช้ image.json อย่างเดียว
@@ -139,7 +190,7 @@ def load_document_bundle(base_dir: str, doc_id: str) -> DocumentBundle:
         item.setdefault("doc_id", metadata.doc_id)
         item.setdefault("doc_type", metadata.doc_type)
 
-    images: List[ImageItem] = [ImageItem(**item) for item in image_list_raw]
+    images: List[ImageItem] = _IMAGES_ADAPTER.validate_python(image_list_raw)
 
     # ----------------------------------------------------
     # 5) รวมทั้งหมดเป็น DocumentBundle
@@ -1,9 +1,18 @@
 from __future__ import annotations
 
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List
-import json
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import orjson
 
 
 # โฟลเดอร์เก็บ log = <root>/logs/qa_log.jsonl
@@ -13,6 +22,50 @@ LOG_FILE = LOG_DIR / "qa_log.jsonl"
 
 LOG_DIR.mkdir(exist_ok=True)
 
+# เปิดไฟล์ค้างไว้ + buffer 64KB แล้ว flush เป็นรอบ ๆ (แทน open/close ทุกครั้ง)
+LOG_BUFFER_SIZE = 1 << 16
+LOG_FLUSH_INTERVAL = 1.0  # วินาที
+
+_log_fh: Optional[BinaryIO] = None
+_log_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+
+# อ่าน log จากท้ายไฟล์ทีละ block (ไม่ต้องอ่านทั้งไฟล์)
+TAIL_BLOCK_SIZE = 1 << 16
+
+# cache ผล read_logs ล่าสุด: key = (mtime_ns, size, limit)
+_read_cache: Dict[Tuple[int, int, int], List[Dict[str, Any]]] = {}
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(LOG_FLUSH_INTERVAL)
+        flush_logs()
+
+
+def _get_log_fh() -> BinaryIO:
+    """
+    เปิดไฟล์ log ครั้งแรกที่ใช้ แล้วเริ่ม thread สำหรับ flush ทุก LOG_FLUSH_INTERVAL
+    (ต้องถือ _log_lock อยู่ตอนเรียก)
+    """
+    global _log_fh, _flusher
+    if _log_fh is None:
+        _log_fh = LOG_FILE.open("ab", buffering=LOG_BUFFER_SIZE)
+        atexit.register(flush_logs)
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_loop, name="qa-log-flusher", daemon=True)
+        _flusher.start()
+    return _log_fh
+
+
+def flush_logs() -> None:
+    """
+    เขียน log ที่ค้างใน buffer ลงดิสก์
+    """
+    with _log_lock:
+        if _log_fh is not None:
+            _log_fh.flush()
+
 
 def append_log(entry: Dict[str, Any]) -> None:
     """
@@ -24,30 +77,130 @@ def append_log(entry: Dict[str, Any]) -> None:
     payload = dict(entry)
     payload.setdefault("ts", datetime.utcnow().isoformat() + "Z")
 
-    with LOG_FILE.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    line = orjson.dumps(payload) + b"\n"
+    with _log_lock:
+        _get_log_fh().write(line)
+
+
+def _tail_lines(path: Path, limit: int) -> List[bytes]:
+    """
+    อ่านบรรทัดที่ไม่ว่างจากท้ายไฟล์ไม่เกิน limit บรรทัด
+    โดย seek ถอยหลังทีละ TAIL_BLOCK_SIZE จนได้ครบ
+    """
+    with path.open("rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        buf = b""
+        lines: List[bytes] = []
+
+        while pos > 0:
+            step = min(TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+
+            lines = [ln for ln in buf.splitlines() if ln.strip()]
+            # ยังอ่านไม่ถึงต้นไฟล์ → บรรทัดแรกอาจขาดครึ่ง ไม่นับ
+            if pos > 0 and lines:
+                lines = lines[1:]
+            if len(lines) >= limit:
+                break
+
+    return lines[-limit:]
 
 
 def read_logs(limit: int = 50) -> List[Dict[str, Any]]:
     """
     อ่าน log ย้อนหลังใหม่สุดไม่เกิน limit รายการ
+    - อ่านจากท้ายไฟล์เฉพาะส่วนที่ต้องใช้
+    - ถ้าไฟล์ไม่เปลี่ยน (mtime + size เท่าเดิม) คืนผลที่ cache ไว้
     """
-    if not LOG_FILE.exists():
-        return []
-
-    with LOG_FILE.open("r", encoding="utf-8") as f:
-        lines = f.readlines()
+    # flush ของที่ค้างใน buffer ก่อน ไม่งั้นจะไม่เห็น log ล่าสุด
+    flush_logs()
 
-    lines = [ln.strip() for ln in lines if ln.strip()]
-    if not lines:
+    if limit <= 0 or not LOG_FILE.exists():
         return []
 
-    selected = lines[-limit:]
+    st = LOG_FILE.stat()
+    cache_key = (st.st_mtime_ns, st.st_size, limit)
+    cached = _read_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
+
     logs: List[Dict[str, Any]] = []
-    for ln in selected:
+    for ln in _tail_lines(LOG_FILE, limit):
         try:
-            logs.append(json.loads(ln))
-        except json.JSONDecodeError:
+            logs.append(orjson.loads(ln))
+        except orjson.JSONDecodeError:
             continue
 
-    return logs
+    _read_cache.clear()
+    _read_cache[cache_key] = logs
+    return list(logs)
+
+
+# -----------------------------------------------------------
+# Diagnostic logging (stderr ผ่าน queue → thread แยกเป็นคนเขียน)
+# -----------------------------------------------------------
+
+_DIAG_FORMAT = "[%(levelname)s] %(name)s: %(message)s"
+
+_diag_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_diag_listener: Optional[logging.handlers.QueueListener] = None
+_diag_lock = threading.Lock()
+
+
+def _start_diag_listener() -> None:
+    """เริ่ม QueueListener ที่เขียน log ลง stderr (ต้องถือ _diag_lock อยู่)"""
+    global _diag_listener
+    q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _diag_queue_handler.queue = q
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(_DIAG_FORMAT))
+
+    _diag_listener = logging.handlers.QueueListener(q, stream_handler)
+    _diag_listener.start()
+
+
+def _direct_diag_logging_after_fork() -> None:
+    # thread ของ listener ไม่ตามไปใน process ลูก และ worker ของ process pool
+    # จบด้วย os._exit (ไม่เรียก atexit) → ในลูกให้เขียน stderr ตรง ๆ แทน กัน log หาย
+    global _diag_lock, _diag_listener
+    _diag_lock = threading.Lock()
+    _diag_listener = None
+    if _diag_queue_handler is None:
+        return
+
+    root = logging.getLogger("backend")
+    root.removeHandler(_diag_queue_handler)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(_DIAG_FORMAT))
+    root.addHandler(stream_handler)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_direct_diag_logging_after_fork)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    คืน logger สำหรับ diagnostic (แทน print)
+    - ทุก logger ใต้ "backend" ส่งเข้า queue แล้วให้ thread แยกเขียนลง stderr
+    - ระดับ log ตั้งได้ด้วย env BACKEND_LOG_LEVEL (default: INFO)
+    """
+    global _diag_queue_handler
+    with _diag_lock:
+        if _diag_queue_handler is None:
+            root = logging.getLogger("backend")
+            root.setLevel(os.getenv("BACKEND_LOG_LEVEL", "INFO").upper())
+            root.propagate = False
+
+            _diag_queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+            root.addHandler(_diag_queue_handler)
+            _start_diag_listener()
+            atexit.register(lambda: _diag_listener and _diag_listener.stop())
+
+    # เช่นรันด้วย python -m → __name__ == "__main__" ก็ยังให้อยู่ใต้ "backend"
+    if name != "backend" and not name.startswith("backend."):
+        name = f"backend.{name}"
+    return logging.getLogger(name)
@@ -1,16 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import io
+import re
+from functools import lru_cache
 from typing import Dict, List, Optional
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-from .vector_store import search_similar
+from . import reranker, semantic_cache
+from .embeddings import embed_query
+from .vector_store import search_similar_by_vector
 
 
+@lru_cache(maxsize=1)
 def _get_llm() -> ChatGoogleGenerativeAI:
     """
     เตรียม LLM (Gemini) สำหรับตอบคำถาม
     ใช้ GOOGLE_API_KEY จาก .env เหมือน embeddings
+
+    สร้างครั้งเดียวแล้วใช้ซ้ำทุก request (classify + answer ใช้ตัวเดียวกัน)
+    → connection pool / channel ของ client อุ่นอยู่ตลอด
     """
     llm = ChatGoogleGenerativeAI(
         model="gemini-2.5-flash",
@@ -22,6 +32,45 @@ def _get_llm() -> ChatGoogleGenerativeAI:
 # -------------------------------------------------------------------
 # 1) Rule-based intent (ถูก ๆ เร็ว ๆ ก่อน)
 # -------------------------------------------------------------------
+
+# keyword ที่มักเกี่ยวข้องกับ "ตารางข้อมูล" ในหลาย ๆ โดเมน
+_TABLE_KEYWORDS = [
+    "ตาราง",
+    "table",
+    "รายการ",
+    "รายชื่อ",
+    "สรุปข้อมูล",
+    "สรุปผล",
+    "สถิติ",
+    "สรุปคะแนน",
+    "แถวที่",
+    "คอลัมน์",
+    "column",
+    "row",
+    "ชีท",
+    "sheet",
+]
+
+# keyword ที่มักเกี่ยวข้องกับรูป / กราฟ
+_IMAGE_KEYWORDS = [
+    "รูป",
+    "รูปภาพ",
+    "image",
+    "logo",
+    "โลโก้",
+    "กราฟ",
+    "graph",
+    "chart",
+    "แผนภาพ",
+    "diagram",
+    "แผนภูมิ",
+]
+
+# compile ครั้งเดียวตอน import → สแกน query รอบเดียวต่อกลุ่ม แทน `kw in q` ทีละคำ
+_TABLE_RE = re.compile("|".join(map(re.escape, _TABLE_KEYWORDS)))
+_IMAGE_RE = re.compile("|".join(map(re.escape, _IMAGE_KEYWORDS)))
+
+
 def _rule_based_intent(query: str) -> Optional[str]:
     """
     เดา intent แบบ rule-based ง่าย ๆ จาก keyword
@@ -31,41 +80,8 @@ def _rule_based_intent(query: str) -> Optional[str]:
     """
     q = query.lower().strip()
 
-    # keyword ที่มักเกี่ยวข้องกับ "ตารางข้อมูล" ในหลาย ๆ โดเมน
-    table_keywords = [
-        "ตาราง",
-        "table",
-        "รายการ",
-        "รายชื่อ",
-        "สรุปข้อมูล",
-        "สรุปผล",
-        "สถิติ",
-        "สรุปคะแนน",
-        "แถวที่",
-        "คอลัมน์",
-        "column",
-        "row",
-        "ชีท",
-        "sheet",
-    ]
-
-    # keyword ที่มักเกี่ยวข้องกับรูป / กราฟ
-    image_keywords = [
-        "รูป",
-        "รูปภาพ",
-        "image",
-        "logo",
-        "โลโก้",
-        "กราฟ",
-        "graph",
-        "chart",
-        "แผนภาพ",
-        "diagram",
-        "แผนภูมิ",
-    ]
-
-    is_table = any(kw in q for kw in table_keywords)
-    is_image = any(kw in q for kw in image_keywords)
+    is_table = _TABLE_RE.search(q) is not None
+    is_image = _IMAGE_RE.search(q) is not None
 
     if is_table and not is_image:
         return "table"
@@ -82,6 +98,29 @@ def _rule_based_intent(query: str) -> Optional[str]:
     return None
 
 
+# system prompt ที่ไม่เปลี่ยนตาม request → สร้างครั้งเดียว และวางไว้ต้น prompt เสมอ
+# ส่วน prefix ที่ซ้ำกันทุกครั้งจึงโดน implicit context cache ของ Gemini ได้
+_CLASSIFY_SYSTEM_PROMPT = (
+    "คุณเป็นตัวจัดประเภทคำถามเกี่ยวกับเอกสาร PDF หลายประเภท "
+    "เช่น รายงานบริษัท รายงานวิชาการ คู่มือ สัญญา เอกสารการเงิน ฯลฯ\n"
+    "เป้าหมายคือบอกว่าเมื่อจะตอบคำถามนี้ เราควรโฟกัสข้อมูลจากไหนเป็นหลัก:\n"
+    "- text  = เนื้อหาบรรยาย / ย่อหน้า / ข้อความยาว ๆ\n"
+    "- table = ข้อมูลในตาราง เช่น แถว-คอลัมน์ รายการ สรุปตัวเลข\n"
+    "- both  = ต้องใช้ทั้งข้อความและข้อมูลตารางร่วมกัน\n\n"
+    "ให้ตอบสั้น ๆ เป็นคำเดียวเท่านั้น หนึ่งใน: text, table, both.\n"
+)
+
+_ANSWER_SYSTEM_PREFIX = (
+    "คุณเป็นผู้ช่วยอ่านและวิเคราะห์เอกสาร PDF หลายประเภท "
+    "(เช่น รายงานบริษัท รายงานวิชาการ คู่มือ สัญญา เอกสารการเงิน ฯลฯ).\n"
+    "ให้ตอบคำถามโดยอ้างอิงเฉพาะจาก CONTEXT ด้านล่างนี้เท่านั้น "
+    "ห้ามเดาเกินข้อมูลในเอกสาร.\n"
+    "ถ้าข้อมูลไม่พอ ให้ตอบว่า 'ไม่ทราบจากข้อมูลที่มีอยู่'.\n"
+    "ให้ตอบคำถามของผู้ใช้ให้กระชับ ชัดเจน "
+    "และอ้างอิงจากเนื้อหาใน CONTEXT เท่านั้น.\n\n"
+)
+
+
 # -------------------------------------------------------------------
 # 2) LLM-based intent (ละเอียดแต่แพงกว่า)
 # -------------------------------------------------------------------
@@ -96,20 +135,10 @@ async def classify_query_intent(query: str) -> str:
     """
     llm = _get_llm()
 
-    system_prompt = (
-        "คุณเป็นตัวจัดประเภทคำถามเกี่ยวกับเอกสาร PDF หลายประเภท "
-        "เช่น รายงานบริษัท รายงานวิชาการ คู่มือ สัญญา เอกสารการเงิน ฯลฯ\n"
-        "เป้าหมายคือบอกว่าเมื่อจะตอบคำถามนี้ เราควรโฟกัสข้อมูลจากไหนเป็นหลัก:\n"
-        "- text  = เนื้อหาบรรยาย / ย่อหน้า / ข้อความยาว ๆ\n"
-        "- table = ข้อมูลในตาราง เช่น แถว-คอลัมน์ รายการ สรุปตัวเลข\n"
-        "- both  = ต้องใช้ทั้งข้อความและข้อมูลตารางร่วมกัน\n\n"
-        "ให้ตอบสั้น ๆ เป็นคำเดียวเท่านั้น หนึ่งใน: text, table, both.\n"
-    )
-
     user_prompt = f"คำถาม: {query}\n\nตอบแค่หนึ่งคำ: text, table หรือ both"
 
     resp = await llm.ainvoke(
-        [("system", system_prompt), ("user", user_prompt)]
+        [("system", _CLASSIFY_SYSTEM_PROMPT), ("user", user_prompt)]
     )
     raw = (resp.content or "").strip().lower()
 
@@ -120,26 +149,33 @@ async def classify_query_intent(query: str) -> str:
     return "text"
 
 
+# metadata ว่างที่ใช้ร่วมกัน (อ่านอย่างเดียว) แทนการสร้าง {} ใหม่ทุก doc
+_EMPTY_META: Dict = {}
+
+
 # -------------------------------------------------------------------
 # 3) รวม context จากเอกสาร
 # -------------------------------------------------------------------
 def _build_context_text(docs) -> str:
     """
     รวม context จากเอกสารที่ค้นมาให้ LLM
+    เขียนต่อกันใน StringIO ทีละส่วน (ไม่ต้องสร้าง header / parts ชั่วคราวแล้วค่อย join)
     """
-    parts: List[str] = []
+    buf = io.StringIO()
+
     for i, d in enumerate(docs, start=1):
-        meta = d.metadata or {}
-        doc_id = meta.get("doc_id", "unknown")
-        page = meta.get("page", "?")
-        source = meta.get("source", "text")
-        doc_type = meta.get("doc_type") or "unknown"
-        header = (
-            f"[{i}] (doc_id={doc_id}, page={page}, "
-            f"source={source}, doc_type={doc_type})"
+        meta = d.metadata or _EMPTY_META
+        if i > 1:
+            buf.write("\n\n")
+        buf.write(
+            f"[{i}] (doc_id={meta.get('doc_id', 'unknown')}, "
+            f"page={meta.get('page', '?')}, "
+            f"source={meta.get('source', 'text')}, "
+            f"doc_type={meta.get('doc_type') or 'unknown'})\n"
         )
-        parts.append(f"{header}\n{d.page_content}")
-    return "\n\n".join(parts)
+        buf.write(d.page_content)
+
+    return buf.getvalue()
 
 
 # -------------------------------------------------------------------
@@ -153,29 +189,60 @@ async def answer_question(
 ) -> Dict:
     """
     RAG flow:
+    0) ลองหาใน semantic cache ก่อน (คำถามความหมายเดียวกัน + doc_ids/mode/top_k เดียวกัน)
     1) ตัดสินใจ intent → text / table / both (rule-based + LLM)
     2) search จาก vector DB ด้วย filter ที่เหมาะสม (doc_ids + source)
+       (ถ้ามี cross-encoder → ดึงเผื่อแล้ว rerank เหลือ top_k)
     3) รวม context เป็น prompt
     4) ให้ LLM ตอบ
 
     รองรับเอกสารหลายประเภท ไม่จำกัดแค่ statement การเงิน
     """
 
+    # ----------------------------------------
+    # 0) semantic cache
+    # ----------------------------------------
+    query_vec = await asyncio.to_thread(embed_query, query)
+    cache_scope = (
+        tuple(sorted(doc_ids)) if doc_ids else None,
+        mode,
+        top_k,
+    )
+    cached = semantic_cache.lookup(query_vec, cache_scope)
+    if cached is not None:
+        return cached
+
     # ----------------------------------------
     # 1) ตัดสินใจ intent ตาม mode
     # ----------------------------------------
-    if mode == "auto":
+    # ถ้าต้องพึ่ง LLM classify → ยิง search แบบไม่ filter source ไปพร้อมกันเลย
+    # (ดึงเผื่อ x2 แล้วค่อย filter ตาม intent ทีหลัง)
+    speculative_docs = None
+
+    # มี reranker → ดึงเผื่อหลายเท่าแล้วให้ cross-encoder คัดเหลือ top_k
+    fetch_k = top_k * reranker.RERANK_OVERFETCH if reranker.is_enabled() else top_k
+
+    if mode in ("text", "table", "both"):
+        # ใช้ค่าที่ user เลือกบังคับเลย
+        intent = mode
+    elif mode == "auto":
         # ลองใช้ rule-based ก่อน
         intent = _rule_based_intent(query)
         if intent is None:
-            # ถ้าดูไม่ออก → ให้ LLM ช่วย classify
-            intent = await classify_query_intent(query)
-    elif mode in ("text", "table", "both"):
-        # ใช้ค่าที่ user เลือกบังคับเลย
-        intent = mode
+            # ถ้าดูไม่ออก → ให้ LLM ช่วย classify (คู่ขนานกับ search)
+            intent, speculative_docs = await asyncio.gather(
+                classify_query_intent(query),
+                asyncio.to_thread(
+                    search_similar_by_vector,
+                    embedding=query_vec,
+                    k=fetch_k * 2,
+                    doc_ids=doc_ids,
+                    sources=None,
+                ),
+            )
     else:
-        # mode แปลก → ถือว่า auto
-        intent = _rule_based_intent(query) or await classify_query_intent(query)
+        # mode แปลก (API รับแค่ค่าใน Literal อยู่แล้ว) → ถือเป็น text ไม่ต้องเสีย LLM call
+        intent = "text"
 
     # map intent -> source_filter
     if intent == "text":
@@ -192,12 +259,30 @@ async def answer_question(
     # ----------------------------------------
     # 2) search similar docs จาก vector DB
     # ----------------------------------------
-    docs = search_similar(
-        query=query,
-        k=top_k,
-        doc_ids=doc_ids,
-        sources=source_filter,
-    )
+    docs = None
+    if speculative_docs is not None:
+        docs = [
+            d
+            for d in speculative_docs
+            if source_filter is None or (d.metadata or {}).get("source") in source_filter
+        ][:fetch_k]
+        # ผลที่เหลือหลัง filter ไม่พอ (เพื่อนบ้านใกล้สุดเป็น source อื่นซะส่วนใหญ่)
+        # → ค้นใหม่แบบ filter source จริง ไม่ให้ได้ผลน้อยกว่า / ว่างกว่าการค้นปกติ
+        if len(docs) < fetch_k:
+            docs = None
+
+    if docs is None:
+        # Chroma query เป็น sync (SQLite + HNSW) → ย้ายไป thread ไม่ให้บล็อก event loop
+        docs = await asyncio.to_thread(
+            search_similar_by_vector,
+            embedding=query_vec,
+            k=fetch_k,
+            doc_ids=doc_ids,
+            sources=source_filter,
+        )
+
+    if len(docs) > top_k:
+        docs = await asyncio.to_thread(reranker.rerank, query, docs, top_k)
 
     if not docs:
         return {
@@ -212,18 +297,12 @@ async def answer_question(
     # ----------------------------------------
     context_text = _build_context_text(docs)
 
+    # static prefix ก่อน แล้วค่อยต่อส่วนที่เปลี่ยนทุก request (intent/mode/CONTEXT)
+    # f-string เดียว → ต่อ string ครั้งเดียว ไม่มี string ชั่วคราวระหว่างทาง
     system_prompt = (
-        "คุณเป็นผู้ช่วยอ่านและวิเคราะห์เอกสาร PDF หลายประเภท "
-        "(เช่น รายงานบริษัท รายงานวิชาการ คู่มือ สัญญา เอกสารการเงิน ฯลฯ).\n"
-        "ให้ตอบคำถามโดยอ้างอิงเฉพาะจาก CONTEXT ด้านล่างนี้เท่านั้น "
-        "ห้ามเดาเกินข้อมูลในเอกสาร.\n"
-        "ถ้าข้อมูลไม่พอ ให้ตอบว่า 'ไม่ทราบจากข้อมูลที่มีอยู่'.\n\n"
+        f"{_ANSWER_SYSTEM_PREFIX}"
         f"(query intent: {intent}, mode: {mode})\n\n"
-        "=== CONTEXT START ===\n"
-        f"{context_text}\n"
-        "=== CONTEXT END ===\n\n"
-        "ตอนนี้ให้ตอบคำถามของผู้ใช้ด้านล่างให้กระชับ ชัดเจน "
-        "และอ้างอิงจากเนื้อหาใน CONTEXT เท่านั้น."
+        f"=== CONTEXT START ===\n{context_text}\n=== CONTEXT END ==="
     )
 
     user_prompt = query
@@ -240,21 +319,21 @@ async def answer_question(
     # ----------------------------------------
     # 4) เตรียม sources สำหรับ frontend + history
     # ----------------------------------------
-    sources = []
-    for d in docs:
-        meta = d.metadata or {}
-        sources.append(
-            {
-                "doc_id": meta.get("doc_id"),
-                "page": meta.get("page"),
-                "source": meta.get("source"),
-                "chunk_id": meta.get("chunk_id"),
-            }
-        )
+    sources = [
+        {
+            "doc_id": meta.get("doc_id"),
+            "page": meta.get("page"),
+            "source": meta.get("source"),
+            "chunk_id": meta.get("chunk_id"),
+        }
+        for meta in (d.metadata or _EMPTY_META for d in docs)
+    ]
 
-    return {
+    result = {
         "answer": answer_text,
         "sources": sources,
         "intent": intent,
         "mode": mode,
     }
+    semantic_cache.add(query_vec, cache_scope, result)
+    return result
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import os
+import threading
+from functools import lru_cache
+from typing import List
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # ไม่ได้ลง sentence-transformers → ข้ามการ rerank
+    CrossEncoder = None
+
+
+# cross-encoder ที่ใช้จัดอันดับ (query, chunk) ใหม่ หลังดึงจาก vector DB เผื่อไว้
+RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
+
+# ดึงจาก vector DB มากี่เท่าของ top_k ก่อนให้ reranker คัดเหลือ top_k
+RERANK_OVERFETCH = 3
+
+_predict_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    """มี sentence-transformers ให้ใช้ และไม่ได้ปิดด้วย RERANKER_MODEL="" """
+    return CrossEncoder is not None and bool(RERANKER_MODEL_NAME)
+
+
+@lru_cache(maxsize=1)
+def _get_reranker() -> "CrossEncoder":
+    """โหลดโมเดลครั้งเดียวตอนใช้ครั้งแรก แล้วใช้ซ้ำทุก request"""
+    return CrossEncoder(RERANKER_MODEL_NAME)
+
+
+def rerank(query: str, docs: List, top_k: int) -> List:
+    """
+    จัดอันดับ docs (langchain Document) ใหม่ด้วย cross-encoder แล้วคืน top_k ตัวแรก
+    ถ้าไม่มี reranker → คืน docs ตามลำดับเดิม (ตัดเหลือ top_k)
+    """
+    if not is_enabled() or len(docs) <= 1:
+        return docs[:top_k]
+
+    pairs = [(query, d.page_content) for d in docs]
+    with _predict_lock:
+        scores = _get_reranker().predict(pairs)
+
+    order = sorted(range(len(docs)), key=lambda i: float(scores[i]), reverse=True)
+    return [docs[i] for i in order[:top_k]]
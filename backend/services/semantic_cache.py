@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+# ถือว่าเป็นคำถามเดียวกันถ้า cosine similarity ของ query embedding เกินค่านี้
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_TTL = 300  # วินาที
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+
+_lock = threading.Lock()
+
+# เก็บ vector (normalize แล้ว) เป็น matrix เดียว แถวที่ i คู่กับ _entries[i]
+# → หา cosine similarity ทั้งหมดได้ด้วย matmul ครั้งเดียว (เหมือน flat inner-product index)
+_vectors: Optional[np.ndarray] = None
+_entries: List[Dict[str, Any]] = []
+
+
+def _normalize(vec: Sequence[float]) -> np.ndarray:
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    if norm > 0:
+        arr = arr / norm
+    return arr
+
+
+def _drop(indices: List[int]) -> None:
+    """ลบ entry ตาม index (ต้องถือ _lock อยู่)"""
+    global _vectors, _entries
+    if not indices or _vectors is None:
+        return
+    drop = set(indices)
+    keep = [i for i in range(len(_entries)) if i not in drop]
+    _entries = [_entries[i] for i in keep]
+    _vectors = _vectors[keep] if keep else None
+
+
+def lookup(query_vec: Sequence[float], scope: Hashable) -> Optional[Dict[str, Any]]:
+    """
+    หา answer ที่เคยตอบไว้สำหรับคำถามที่ "ความหมายเดียวกัน"
+    - scope = เงื่อนไขอื่น ๆ ของคำถาม (doc_ids, mode, top_k) ต้องตรงกันเป๊ะ
+    - คืน result dict ถ้าเจอและยังไม่หมดอายุ, ไม่เจอ → None
+    """
+    q = _normalize(query_vec)
+    now = time.time()
+
+    with _lock:
+        if _vectors is None:
+            return None
+
+        expired = [i for i, e in enumerate(_entries) if now - e["ts"] > SEMANTIC_CACHE_TTL]
+        _drop(expired)
+        if _vectors is None:
+            return None
+
+        scores = _vectors @ q
+        for i in np.argsort(-scores):
+            if scores[i] < SEMANTIC_CACHE_THRESHOLD:
+                break
+            entry = _entries[i]
+            if entry["scope"] == scope:
+                entry["last_used"] = now
+                return dict(entry["result"])
+
+    return None
+
+
+def add(query_vec: Sequence[float], scope: Hashable, result: Dict[str, Any]) -> None:
+    """
+    เก็บคำตอบของคำถามนี้ไว้ใน cache (เกิน SEMANTIC_CACHE_MAX_ENTRIES → ลบตัวที่ใช้ล่าสุดนานที่สุด)
+    """
+    global _vectors
+    q = _normalize(query_vec)
+    now = time.time()
+
+    with _lock:
+        if _vectors is not None and q.shape[0] != _vectors.shape[1]:
+            # โมเดล embedding เปลี่ยน (dim ไม่ตรง) → ล้างของเก่าทิ้ง
+            _drop(list(range(len(_entries))))
+
+        if len(_entries) >= SEMANTIC_CACHE_MAX_ENTRIES:
+            lru_idx = min(range(len(_entries)), key=lambda i: _entries[i]["last_used"])
+            _drop([lru_idx])
+
+        _entries.append(
+            {"scope": scope, "result": dict(result), "ts": now, "last_used": now}
+        )
+        row = q[np.newaxis, :]
+        _vectors = row if _vectors is None else np.vstack([_vectors, row])
+
+
+def clear() -> None:
+    """ล้าง cache ทั้งหมด (เช่น หลังมีเอกสารใหม่เข้า vector DB)"""
+    with _lock:
+        _drop(list(range(len(_entries))))
@@ -1,74 +1,90 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
 from langchain_community.vectorstores import Chroma
 
-from .chunking import Chunk
-from .embeddings import get_embedding_client
-
-from fastapi import HTTPException
-from langchain_google_genai._common import GoogleGenerativeAIError
+from .chunking import Chunk, content_hash, dedup_by_content
+from .embeddings import CachedEmbeddings, embed_texts
 
 CHROMA_DIR = "chroma_db"
 COLLECTION_NAME = "documents"
 
+# จำนวน chunk ต่อ 1 ครั้งที่ upsert เข้า Chroma
+INDEX_BATCH_SIZE = 128
 
-def search_similar(query: str, top_k: int = 5):
-    try:
-        docs = vectordb.similarity_search(query, k=top_k)
-        return docs
-    except GoogleGenerativeAIError as e:
-        print("Embedding error:", e)  # log หลังบ้าน
-        raise HTTPException(
-            status_code=500,
-            detail="Embedding error: โปรดตรวจสอบ GOOGLE_API_KEY ใน .env (อาจใช้ไม่ได้ / หมดอายุ / ถูกปิด)"
-        )
+# ตั้งค่า HNSW index ของ collection (มีผลตอนสร้าง collection ใหม่เท่านั้น)
+# - cosine: ตรงกับ embedding ของ Gemini ที่ใช้วัดความคล้ายด้วย cosine
+# - M / ef: ค่ากลาง ๆ ที่ recall ดีโดย query ยังเร็ว
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 64,
+    "hnsw:search_ef": 64,
+}
 
 
+@lru_cache(maxsize=8)
 def get_vector_store(
     persist_directory: str = CHROMA_DIR,
     collection_name: str = COLLECTION_NAME,
 ) -> Chroma:
     """
-    คืน Chroma vector store ที่ผูกกับ Gemini embeddings
+    คืน Chroma vector store ที่ผูกกับ Gemini embeddings (ผ่าน cache)
+
+    เปิดครั้งเดียวต่อ (persist_directory, collection_name) แล้วใช้ซ้ำ
+    → search / index ไม่ต้องสร้าง client + เปิด SQLite ของ Chroma ใหม่ทุกครั้ง
     """
     persist_path = Path(persist_directory)
     persist_path.mkdir(parents=True, exist_ok=True)
 
-    embeddings = get_embedding_client()
+    embeddings = CachedEmbeddings()
 
     vectordb = Chroma(
         collection_name=collection_name,
         embedding_function=embeddings,
         persist_directory=str(persist_path),
+        collection_metadata=HNSW_METADATA,
     )
     return vectordb
 
 
+# type ที่ Chroma รับได้ตรง ๆ (เช็คด้วย set lookup ก่อน → เร็วกว่า isinstance ทีละตัว)
+_SIMPLE_TYPES = frozenset({str, int, float, bool, type(None)})
+_SIMPLE_TYPE_TUPLE = (str, int, float, bool)
+
+
 def _normalize_metadata(md: dict) -> dict:
     """
     Chroma รับได้เฉพาะค่าแบบ str/int/float/bool/None
-    อันนี้เลยแปลงพวก list/dict/object ให้กลายเป็น string
+    อันนี้เลยแปลงพวก list/dict/object ให้กลายเป็น string เช่น bbox, columns, ฯลฯ
     """
-    simple: dict = {}
-    for k, v in md.items():
-        if isinstance(v, (str, int, float, bool)) or v is None:
-            simple[k] = v
-        else:
-            # แปลงของซับซ้อนเป็น string เช่น bbox, columns, ฯลฯ
-            simple[k] = str(v)
-    return simple
+    return {
+        k: v
+        if type(v) in _SIMPLE_TYPES or isinstance(v, _SIMPLE_TYPE_TUPLE)
+        else str(v)
+        for k, v in md.items()
+    }
 
 
 def index_chunks(
     chunks: List[Chunk],
     persist_directory: str = CHROMA_DIR,
     collection_name: str = COLLECTION_NAME,
+    vectors_by_hash: Optional[Dict[str, List[float]]] = None,
+    flush: bool = False,
 ) -> None:
     """
-    เอา chunks ทั้งหมดไปเก็บใน Chroma
+    เอา chunks ทั้งหมดไปเก็บใน Chroma (upsert เป็นก้อน ๆ ละ INDEX_BATCH_SIZE)
+
+    ถ้าส่ง vectors_by_hash (content_hash -> vector) มา จะใช้ vector นั้นเลย
+    ไม่ส่งมา → embed ทั้งหมดทีเดียวผ่าน embed_texts (ขนาน + ผ่าน cache)
+    chunk ที่ content ซ้ำกันใช้ vector ร่วมกัน
+
+    flush=True → เรียก persist() ตอนท้าย (ให้คนเรียกสั่งครั้งเดียวตอนจบงาน)
+    Chroma >= 0.4 เขียนลงดิสก์เองอยู่แล้ว ส่วนนี้มีไว้เผื่อ Chroma รุ่นเก่า
     """
     if not chunks:
         return
@@ -78,31 +94,67 @@ def index_chunks(
         collection_name=collection_name,
     )
 
-    texts = [c.content for c in chunks]
+    if vectors_by_hash is None:
+        unique = dedup_by_content(chunks)
+        vectors = embed_texts(list(unique.values()))
+        vectors_by_hash = dict(zip(unique.keys(), vectors))
+
+    # สร้าง ids / metadatas / vectors ทีละก้อน → ไม่ต้องถือ list ขนาดเท่าทั้ง corpus
+    # และไม่ชน max batch size ของ Chroma ตอน doc ใหญ่ ๆ
+    for start in range(0, len(chunks), INDEX_BATCH_SIZE):
+        batch = chunks[start : start + INDEX_BATCH_SIZE]
+        texts = [c.content for c in batch]
+
+        # merge + normalize ในรอบเดียว ไม่ต้องเก็บ list ของ dict ชั่วคราว
+        metadatas = [
+            _normalize_metadata(
+                {
+                    **c.metadata,
+                    "doc_id": c.doc_id,
+                    "doc_type": c.doc_type,
+                    "source": c.source,
+                    "page": c.page,
+                    "chunk_id": c.id,
+                }
+            )
+            for c in batch
+        ]
+
+        vectordb._collection.upsert(
+            ids=[c.id for c in batch],
+            embeddings=[vectors_by_hash[content_hash(t)] for t in texts],
+            metadatas=metadatas,
+            documents=texts,
+        )
 
-    raw_metadatas = [
-        c.metadata
-        | {
-            "doc_id": c.doc_id,
-            "doc_type": c.doc_type,
-            "source": c.source,
-            "page": c.page,
-            "chunk_id": c.id,
-        }
-        for c in chunks
-    ]
+    if flush and hasattr(vectordb, "persist"):
+        vectordb.persist()
 
-    metadatas = [_normalize_metadata(md) for md in raw_metadatas]
 
-    ids = [c.id for c in chunks]
+def _build_filter(
+    doc_ids: list[str] | None = None,
+    sources: list[str] | None = None,
+) -> dict | None:
+    """
+    สร้าง filter ตาม doc_ids / source ด้วย syntax filter ใหม่ของ Chroma:
 
-    vectordb.add_texts(
-        texts=texts,
-        metadatas=metadatas,
-        ids=ids,
-    )
+    - ถ้ามีเงื่อนไขเดียว → {"doc_id": {"$in": [...]}}
+    - ถ้ามีหลายเงื่อนไข → {"$and": [ {...}, {...} ]}
+    """
+    conditions: list[dict] = []
+
+    if doc_ids:
+        conditions.append({"doc_id": {"$in": doc_ids}})
+
+    if sources:
+        conditions.append({"source": {"$in": sources}})
+
+    if len(conditions) == 0:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
 
-    vectordb.persist()
 
 def search_similar(
     query: str,
@@ -114,10 +166,7 @@ def search_similar(
 ):
     """
     search จาก Chroma พร้อม filter ตาม doc_ids / source ได้
-    ใช้ syntax filter ใหม่ของ Chroma:
-
-    - ถ้ามีเงื่อนไขเดียว → {"doc_id": {"$in": [...]}}
-    - ถ้ามีหลายเงื่อนไข → {"$and": [ {...}, {...} ]}
+    (query จะถูก embed ผ่าน CachedEmbeddings ของ vector store)
     """
 
     vectordb = get_vector_store(
@@ -125,20 +174,7 @@ def search_similar(
         collection_name=collection_name,
     )
 
-    conditions: list[dict] = []
-
-    if doc_ids:
-        conditions.append({"doc_id": {"$in": doc_ids}})
-
-    if sources:
-        conditions.append({"source": {"$in": sources}})
-
-    if len(conditions) == 0:
-        filter_dict = None
-    elif len(conditions) == 1:
-        filter_dict = conditions[0]
-    else:
-        filter_dict = {"$and": conditions}
+    filter_dict = _build_filter(doc_ids, sources)
 
     if filter_dict:
         docs = vectordb.similarity_search(
@@ -150,3 +186,35 @@ def search_similar(
         docs = vectordb.similarity_search(query, k=k)
 
     return docs
+
+
+def search_similar_by_vector(
+    embedding: List[float],
+    k: int = 5,
+    persist_directory: str = CHROMA_DIR,
+    collection_name: str = COLLECTION_NAME,
+    doc_ids: list[str] | None = None,
+    sources: list[str] | None = None,
+):
+    """
+    เหมือน search_similar แต่รับ query embedding ที่คำนวณไว้แล้ว
+    → ใช้ vector เดียวกับที่ใช้หา semantic cache ได้ ไม่ต้อง embed ซ้ำ
+    """
+
+    vectordb = get_vector_store(
+        persist_directory=persist_directory,
+        collection_name=collection_name,
+    )
+
+    filter_dict = _build_filter(doc_ids, sources)
+
+    if filter_dict:
+        docs = vectordb.similarity_search_by_vector(
+            embedding,
+            k=k,
+            filter=filter_dict,
+        )
+    else:
+        docs = vectordb.similarity_search_by_vector(embedding, k=k)
+
+    return docs
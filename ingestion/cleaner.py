@@ -15,20 +15,29 @@ Data Cleaning Engine ขั้นพื้นฐานสำหรับ:
 from typing import List, Dict, Any
 import re
 
+import numpy as np
+
 from .schema import TextBlock, TableBlock
 
 
 WHITESPACE_RE = re.compile(r"\s+")
 CONTROL_CHAR_RE = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F]")  # เว้น \t, \n, \r
 
+# ตารางลบ control char ชุดเดียวกับ CONTROL_CHAR_RE สำหรับ str.translate
+_CONTROL_CHAR_TABLE = dict.fromkeys(
+    [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20)]
+)
+
 
 def _normalize_text(s: str) -> str:
-    """ล้าง control char + ยุบ whitespace ซ้ำ + strip"""
+    """ล้าง control char + ยุบ whitespace ซ้ำ + strip
+
+    ใช้ str.translate + split/join (วนใน C ทั้งคู่) แทน regex 2 รอบ + strip
+    split() ไม่มี argument ตัดด้วย whitespace ชุดเดียวกับ \s และตัดหัวท้ายให้ในตัว
+    """
     if not s:
         return ""
-    s = CONTROL_CHAR_RE.sub("", s)
-    s = WHITESPACE_RE.sub(" ", s)
-    return s.strip()
+    return " ".join(s.translate(_CONTROL_CHAR_TABLE).split())
 
 
 def clean_text_blocks(blocks: List[TextBlock]) -> List[TextBlock]:
@@ -89,26 +98,31 @@ def clean_table_blocks(tables: List[TableBlock]) -> List[TableBlock]:
         header_clean = [_clean_table_cell(h) for h in header]
         rows_clean = [[_clean_table_cell(str(c)) for c in row] for row in rows]
 
-        # ถ้ามีข้อมูล -> จัดคอลัมน์ใหม่
+        # ถ้ามีข้อมูล -> จัดคอลัมน์ใหม่ด้วย 2-D array (cell ถูก strip มาแล้ว → ว่าง = "")
         if header_clean and rows_clean:
             col_count = max(len(header_clean), max(len(r) for r in rows_clean))
-            header_padded = header_clean + [""] * (col_count - len(header_clean))
-            rows_padded = [r + [""] * (col_count - len(r)) for r in rows_clean]
-
-            keep_col_idx = []
-            for idx in range(col_count):
-                col_vals = [header_padded[idx]] + [r[idx] for r in rows_padded]
-                if any(v.strip() for v in col_vals):
-                    keep_col_idx.append(idx)
-
-            header_final = [header_padded[i] for i in keep_col_idx]
-            rows_final = [[row[i] for i in keep_col_idx] for row in rows_padded]
+            hdr = np.array(
+                header_clean + [""] * (col_count - len(header_clean)), dtype=object
+            )
+            arr = np.empty((len(rows_clean), col_count), dtype=object)
+            arr[:] = ""
+            for i, r in enumerate(rows_clean):
+                arr[i, : len(r)] = r
+
+            # เก็บคอลัมน์ที่ header หรือ cell ใดก็ได้ไม่ว่าง
+            keep_cols = (hdr != "") | (arr != "").any(axis=0)
+            hdr = hdr[keep_cols]
+            arr = arr[:, keep_cols]
+
+            # ลบแถวว่าง
+            arr = arr[(arr != "").any(axis=1)]
+
+            header_final = hdr.tolist()
+            rows_final = arr.tolist()
         else:
             header_final = header_clean
-            rows_final = rows_clean
-
-        # ลบแถวว่าง
-        rows_final = [r for r in rows_final if any(c.strip() for c in r)]
+            # ลบแถวว่าง
+            rows_final = [r for r in rows_clean if any(r)]
 
         tb.header = header_final
         tb.rows = rows_final
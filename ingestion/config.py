@@ -1,10 +1,40 @@
+from __future__ import annotations
+
+import logging
 import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
-# โหลด .env ถ้ามี
+# โหลด .env ถ้ามี (ที่เดียวของทั้งโปรเจกต์ → อ่านไฟล์ครั้งเดียวต่อ process)
+# ทั้ง ingestion และ backend import ค่าจากโมดูลนี้ แทนการเรียก load_dotenv เอง
 env_path = Path(__file__).resolve().parent.parent / ".env"
 if env_path.exists():
     load_dotenv(env_path)
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+
+@lru_cache(maxsize=1)
+def get_genai():
+    """
+    import google.generativeai แล้ว configure ด้วย GEMINI_API_KEY ครั้งเดียวต่อ process
+    (ผู้เรียกต้องเช็คเองก่อนว่ามี GEMINI_API_KEY)
+    """
+    import google.generativeai as genai
+
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+
+def setup_logging(level: str | None = None) -> None:
+    """
+    ตั้งค่า log เริ่มต้นให้ logger ของ ingestion.* (เรียกจาก script ตอนรันเป็นโปรแกรมหลัก)
+    - ระดับ log ตั้งได้ด้วย env INGESTION_LOG_LEVEL (default: INFO)
+    - ถ้า root logger มี handler อยู่แล้ว จะไม่ทำอะไร (เหมือน logging.basicConfig)
+    """
+    logging.basicConfig(
+        level=(level or os.getenv("INGESTION_LOG_LEVEL", "INFO")).upper(),
+        format="[%(name)s] %(message)s",
+    )
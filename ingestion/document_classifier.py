@@ -16,9 +16,28 @@ document_classifier.py
 - ถ้า use_gemini=True → ใช้ LLM ช่วย classify
 """
 
-from typing import List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import accumulate, islice
+from typing import Any, Dict, List, Optional
+from ingestion.config import GEMINI_API_KEY, get_genai
 from ingestion.schema import IngestedDocument, TextBlock, DocumentMetadata
 
+try:
+    # google-re2: จับ pattern แบบ DFA เวลาเป็นเส้นตรงตามความยาวข้อความ ไม่มี backtracking
+    import re2 as _rules_re
+except ImportError:  # ไม่ได้ลง google-re2 → ใช้ re ของ stdlib (ผลเหมือนกัน)
+    _rules_re = re
+
+logger = logging.getLogger(__name__)
+
 
 # -------------------------
 # Document Label Set
@@ -42,51 +61,186 @@ MODEL_CANDIDATES = [
 
 GEMINI_MODEL_NAME = "models/gemini-2.5-pro"
 
+# batch หลายเอกสารใน 1 prompt: จำนวนเอกสารต่อ call และขนาด sample ต่อเอกสาร
+# (นับเป็น byte ของ UTF-8 → ภาษาไทย 3 byte/ตัว ไม่ทำให้ prompt ยาวเกินงบ)
+BATCH_SIZE = 20
+BATCH_SAMPLE_BYTES = 1500
+SINGLE_SAMPLE_BYTES = 6000
+
+# คำสั่งคงที่ของ classifier (ส่งเป็น system_instruction, prompt ต่อเอกสารมีแค่ชื่อไฟล์ + sample)
+# ยาวไม่ถึงขั้นต่ำของ explicit context cache (CachedContent) → พึ่ง implicit prefix cache ของ Gemini แทน
+# ของที่ไม่เปลี่ยน (role + taxonomy + ตัวอย่าง) อยู่หน้าสุดทั้งหมด → prefix เหมือนเดิมทุก call
+# ส่วนเอกสารจริงต่อท้ายหลัง "=== DOCUMENTS ===" เสมอ
+_CLASSIFIER_INSTRUCTION = f"""
+You are a professional document classifier.
+
+Classify EACH PDF document in the request into ONE label from:
+
+{CANDIDATE_TYPES}
+
+Label guide:
+- bank_statement: account statement from a bank (account number, statement period, balances, transaction list)
+- invoice: bill requesting payment (invoice number, due date, line items, tax/VAT)
+- receipt: proof that payment was received (receipt number, paid amount, payment method)
+- purchase_order: buyer's order to a supplier (PO number, ordered items, delivery terms)
+- delivery_note: goods delivery / shipping document (delivered items, quantities, recipient signature)
+- tax_form: government tax form or withholding tax certificate
+- generic: anything that does not clearly fit the labels above
+
+Examples:
+[1] File name: KBank_Statement_2024-03.pdf
+Text sample: \"\"\"Account Summary / Statement Period 01/03/2024 - 31/03/2024 / Opening Balance ...\"\"\"
+[2] File name: scan_0012.pdf
+Text sample: \"\"\"TAX INVOICE / Invoice No. INV-2024-0315 / Due Date / Subtotal / VAT 7% ...\"\"\"
+[3] File name: payment.pdf
+Text sample: \"\"\"ใบเสร็จรับเงิน / Receipt No. R-8841 / Thank you for your payment / Paid by transfer ...\"\"\"
+[4] File name: order_acme.pdf
+Text sample: \"\"\"PURCHASE ORDER / PO Number 4500021 / Ship To / Requested Delivery Date ...\"\"\"
+[5] File name: dn_20240402.pdf
+Text sample: \"\"\"ใบส่งของ / Delivery Note / Qty Delivered / Received by (signature) ...\"\"\"
+[6] File name: wht_50tawi.pdf
+Text sample: \"\"\"หนังสือรับรองการหักภาษี ณ ที่จ่าย ตามมาตรา 50 ทวิ / Revenue Department ...\"\"\"
+Answer for the examples above:
+["bank_statement", "invoice", "receipt", "purchase_order", "delivery_note", "tax_form"]
+
+The documents to classify come after the line "=== DOCUMENTS ===".
+Documents are numbered [1], [2], ...
+Reply with a JSON array containing exactly one label per document, in the same order, e.g.
+["invoice", "receipt"]
+"""
+
+# cache ผล classify ในหน่วยความจำ (LRU) กันยิง Gemini ซ้ำตอนรันเอกสารเดิมอีกรอบ
+LABEL_CACHE_MAXSIZE = 4096
+LABEL_CACHE_SAMPLE_BYTES = 2000
+
+_label_cache: "OrderedDict[str, str]" = OrderedDict()
+_label_cache_lock = threading.Lock()
+
+_model_lock = threading.Lock()
+# model_name -> GenerativeModel
+_models: Dict[str, Any] = {}
+
+# event loop ถาวร 1 ตัว (thread แยก) สำหรับ classify แบบ async
+# - client gRPC-aio ของ SDK ถูกใช้ซ้ำทั้ง process (โมเดล / configure ถูก cache ไว้)
+#   → ต้องยิงบน loop เดิมตลอด ถ้า asyncio.run ทุกครั้ง channel จะผูกกับ loop ที่ปิดไปแล้ว
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _reset_loop_after_fork() -> None:
+    # thread ของ loop ไม่ตามไปใน process ลูก → ให้สร้างใหม่เมื่อจำเป็น
+    global _loop, _loop_lock
+    _loop = None
+    _loop_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_loop_after_fork)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="classifier-loop", daemon=True
+            ).start()
+            _loop = loop
+    return _loop
+
+
+# ยิง batch พร้อมกันได้กี่ call + retry เมื่อโดน rate limit
+MAX_CONCURRENCY = 8
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0  # วินาที (x2 ทุกครั้งที่ retry)
+
+# บังคับให้ตอบเป็น JSON array ของ label ใน CANDIDATE_TYPES + temperature 0 (ตอบเหมือนเดิมทุกครั้ง)
+# ไม่ตั้ง max_output_tokens: โมเดล 2.5 นับ thinking token รวมด้วย ตั้งต่ำไปจะได้คำตอบว่าง
+_GENERATION_CONFIG = {
+    "temperature": 0,
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "array",
+        "items": {"type": "string", "format": "enum", "enum": CANDIDATE_TYPES},
+    },
+}
+
+# fallback ถ้าคำตอบไม่ใช่ JSON: บรรทัดแบบ "[3] invoice"
+_BATCH_ANSWER_RE = re.compile(r"^\s*\[(\d+)\]\s*(.+?)\s*$", re.MULTILINE)
+
 
 # -------------------------
 # HELPER FUNCTION
 # -------------------------
-def _collect_sample_text(texts: List[TextBlock], max_chars: int = 6000) -> str:
-    """รวม text block แรก ๆ เอามาเป็น sample text สำหรับ rule/LLM"""
-    chunks = []
-    total = 0
-    for t in texts:
-        if not t.content:
-            continue
-        if total + len(t.content) > max_chars:
-            break
-        chunks.append(t.content)
-        total += len(t.content)
-    return "\n".join(chunks)
+def _collect_sample_text(
+    texts: List[TextBlock],
+    max_bytes: int = 6000,
+    lowercase: bool = False,
+) -> str:
+    """
+    รวม text block แรก ๆ เอามาเป็น sample text สำหรับ rule/LLM
+    - งบนับเป็น byte ของ UTF-8 (ใกล้เคียงขนาด payload / token จริงกว่านับตัวอักษร)
+    - block สุดท้ายที่ล้น → ตัดให้พอดี max_bytes (ไม่ทิ้งทั้ง block, ไม่ตัดกลางตัวอักษร)
+    - หาจุดตัดจากความยาวสะสม (accumulate + bisect ทำงานในระดับ C) แล้ว join ครั้งเดียว
+    - lowercase=True → lower ครั้งเดียวหลัง join (ข้อความถูกตัดเหลือ max_bytes แล้ว)
+    """
+    # block ที่มีเนื้อแต่ละอันยาว >= 1 byte → ใช้ไม่เกิน max_bytes block แน่นอน
+    encoded = [
+        c.encode("utf-8")
+        for c in islice(filter(None, (t.content for t in texts)), max(max_bytes, 1))
+    ]
+    cumulative = list(accumulate(map(len, encoded)))
+
+    cut = bisect_left(cumulative, max_bytes)
+    if cut < len(encoded):
+        previous = cumulative[cut - 1] if cut else 0
+        encoded = encoded[: cut + 1]
+        encoded[cut] = encoded[cut][: max_bytes - previous]
+
+    # errors="ignore" → ทิ้งเศษ byte ของตัวอักษรที่ถูกตัดครึ่งตรงท้าย
+    sample = b"\n".join(encoded).decode("utf-8", errors="ignore")
+    return sample.lower() if lowercase else sample
 
 
 # ============================================================
 # 1) RULE-BASED CLASSIFIER (พื้นฐาน)
 # ============================================================
+# keyword ของ rule-based รวมเป็น regex เดียว (compile ครั้งเดียวตอน import)
+# สแกนข้อความรอบเดียวแล้วได้ชุดกลุ่มที่เจอ → เช็คลำดับความสำคัญจาก set
+# compile ด้วย re2 ถ้ามี (pattern เป็น literal ล้วน ใช้ได้ทั้ง re และ re2)
+_FILENAME_RULES_RE = _rules_re.compile(
+    r"(?P<statement>statement)|(?P<bank>bank)|(?P<invoice>invoice)|"
+    r"(?P<receipt>receipt)|(?P<purchase_order>po_|purchase_order)"
+)
+_CONTENT_RULES_RE = _rules_re.compile(
+    r"(?P<account_summary>account summary)|(?P<statement_period>statement period)|"
+    r"(?P<invoice>invoice no|tax invoice)|"
+    r"(?P<receipt>receipt no|thank you for your payment)|"
+    r"(?P<purchase_order>purchase order)"
+)
+
+
 def classify_document_rule_based(doc: IngestedDocument) -> str:
     """จำแนกเอกสารแบบง่าย ๆ ไม่ใช้ AI"""
     file_name = doc.metadata.file_name.lower()
-    sample = _collect_sample_text(doc.texts).lower()
 
     # rule from file name
-    if "statement" in file_name and "bank" in file_name:
+    hits = {m.lastgroup for m in _FILENAME_RULES_RE.finditer(file_name)}
+    if "statement" in hits and "bank" in hits:
         return "bank_statement"
-    if "invoice" in file_name:
-        return "invoice"
-    if "receipt" in file_name:
-        return "receipt"
-    if "po_" in file_name or "purchase_order" in file_name:
-        return "purchase_order"
+    for label in ("invoice", "receipt", "purchase_order"):
+        if label in hits:
+            return label
 
     # rule from content
-    if "account summary" in sample and "statement period" in sample:
+    sample = _collect_sample_text(doc.texts, lowercase=True)
+    hits = {m.lastgroup for m in _CONTENT_RULES_RE.finditer(sample)}
+    if "account_summary" in hits and "statement_period" in hits:
         return "bank_statement"
-    if "invoice no" in sample or "tax invoice" in sample:
-        return "invoice"
-    if "receipt no" in sample or "thank you for your payment" in sample:
-        return "receipt"
-    if "purchase order" in sample:
-        return "purchase_order"
+    for label in ("invoice", "receipt", "purchase_order"):
+        if label in hits:
+            return label
 
     return "generic"
 
@@ -94,94 +248,301 @@ def classify_document_rule_based(doc: IngestedDocument) -> str:
 # ============================================================
 # 2) GEMINI-BASED CLASSIFIER
 # ============================================================
+def _label_from_answer(answer: str) -> str:
+    """แปลงคำตอบของ Gemini (lowercase แล้ว) ให้เป็น label ใน CANDIDATE_TYPES"""
+    # normalize
+    answer = answer.replace("label:", "").strip()
+
+    # fuzzy match แบบง่าย ๆ
+    if "bank" in answer and "statement" in answer:
+        return "bank_statement"
+    if "invoice" in answer:
+        return "invoice"
+    if "receipt" in answer:
+        return "receipt"
+    if "purchase" in answer:
+        return "purchase_order"
+
+    return "generic"
+
+
 def classify_document_with_gemini(
     doc: IngestedDocument,
     model_name: Optional[str] = None,
 ) -> str:
     """
-    ใช้ Gemini จำแนกประเภทเอกสาร
+    ใช้ Gemini จำแนกประเภทเอกสาร 1 ไฟล์ (= batch ขนาด 1)
     - ใช้โมเดล fix ตัวเดียว (GEMINI_MODEL_NAME)
     - ไม่เรียก list_models() แล้ว เพื่อลดโอกาสเจอ error แปลก ๆ จาก API
+    - Gemini ใช้ไม่ได้ → fallback เป็น rule-based
     """
-    try:
-        import google.generativeai as genai
-        import os
+    return classify_documents_batch([doc], model_name=model_name)[0]
 
-        # โหลด API KEY
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            print("[document_classifier] GEMINI_API_KEY not set → fallback")
-            return classify_document_rule_based(doc)
 
-        genai.configure(api_key=api_key)
+def _build_batch_prompt(docs: List[IngestedDocument]) -> str:
+    """
+    รวมหลายเอกสารใน prompt เดียว แต่ละตัวมีเลขกำกับ [1], [2], ...
+    (คำสั่ง + label set อยู่ใน _CLASSIFIER_INSTRUCTION ที่ cache ไว้แล้ว)
+    """
+    # เอกสารเดียว → ให้ sample ยาวได้เท่าเดิม, หลายเอกสาร → ตัดสั้นลงให้ prompt พอดี
+    max_bytes = SINGLE_SAMPLE_BYTES if len(docs) == 1 else BATCH_SAMPLE_BYTES
+
+    blocks = []
+    for i, doc in enumerate(docs, start=1):
+        sample_text = _collect_sample_text(doc.texts, max_bytes=max_bytes)
+        blocks.append(
+            f"[{i}] File name: {doc.metadata.file_name}\n"
+            f"Text sample:\n\"\"\"{sample_text}\"\"\""
+        )
+    return "=== DOCUMENTS ===\n" + "\n\n".join(blocks)
 
-        # ถ้าไม่ส่งชื่อโมเดลมา ใช้ค่าคงที่ของเราเอง
-        if model_name is None:
-            model_name = GEMINI_MODEL_NAME
 
-        print(f"[document_classifier] Using Gemini model: {model_name}")
-        model = genai.GenerativeModel(model_name)
+def _get_classifier_model(model_name: str):
+    """
+    คืน GenerativeModel ที่ผูกกับ _CLASSIFIER_INSTRUCTION (สร้างครั้งเดียวต่อชื่อโมเดล)
+    - instruction คงที่อยู่หน้าสุดทุก call → Gemini cache prefix ให้เอง (implicit caching)
+    """
+    with _model_lock:
+        model = _models.get(model_name)
+        if model is not None:
+            return model
+
+        genai = get_genai()
+        model = genai.GenerativeModel(
+            model_name, system_instruction=_CLASSIFIER_INSTRUCTION
+        )
 
-        # เตรียมข้อความ
-        sample_text = _collect_sample_text(doc.texts, max_chars=6000)
+        logger.info("Using Gemini model: %s", model_name)
+        _models[model_name] = model
+        return model
 
-        prompt = f"""
-You are a professional document classifier.
 
-Classify the following PDF text into ONE label:
+def _parse_batch_answer(text: str, n_docs: int) -> Dict[int, str]:
+    """
+    แปลงคำตอบของ batch เป็น {ลำดับเอกสาร (เริ่ม 1): label}
+    - ปกติเป็น JSON array ตาม schema → ใช้ตรง ๆ
+    - ไม่ใช่ JSON → fallback อ่านบรรทัด "[n] label" + fuzzy match
+    """
+    try:
+        answer = json.loads(text)
+    except json.JSONDecodeError:
+        answer = None
 
-{CANDIDATE_TYPES}
+    parsed: Dict[int, str] = {}
+    if isinstance(answer, list):
+        for idx, label in enumerate(answer[:n_docs], start=1):
+            label = str(label).strip().lower()
+            parsed[idx] = label if label in CANDIDATE_TYPES else _label_from_answer(label)
+        return parsed
 
-File name: {doc.metadata.file_name}
+    for m in _BATCH_ANSWER_RE.finditer(text.lower()):
+        idx = int(m.group(1))
+        if 1 <= idx <= n_docs:
+            parsed[idx] = _label_from_answer(m.group(2))
+    return parsed
 
-Text sample:
-\"\"\"{sample_text}\"\"\"
-"""
 
-        resp = model.generate_content(prompt)
-        answer = (resp.text or "").strip().lower()
-        print("[document_classifier] Gemini raw answer:", answer)
+async def _generate_with_retry(model, prompt: str):
+    """
+    เรียก generate_content_async + retry แบบ exponential backoff เมื่อโดน rate limit
+    (ResourceExhausted / 429) ส่วน error อื่น ๆ โยนต่อให้คนเรียก fallback เอง
+    """
+    from google.api_core.exceptions import ResourceExhausted
+
+    delay = RETRY_BASE_DELAY
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await model.generate_content_async(
+                prompt, generation_config=_GENERATION_CONFIG
+            )
+        except ResourceExhausted:
+            if attempt == MAX_RETRIES:
+                raise
+            logger.debug("rate limited → retry in %.1fs", delay)
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+def _label_cache_key(model_name: str, doc: IngestedDocument) -> str:
+    """key ของผล classify = blake2b(model + ชื่อไฟล์ + sample text ช่วงต้น)"""
+    sample = _collect_sample_text(doc.texts, max_bytes=LABEL_CACHE_SAMPLE_BYTES)
+    raw = f"{model_name}\x00{doc.metadata.file_name}\x00{sample}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _label_cache_get(key: str) -> Optional[str]:
+    with _label_cache_lock:
+        label = _label_cache.get(key)
+        if label is not None:
+            _label_cache.move_to_end(key)
+        return label
+
+
+def _label_cache_put(key: str, label: str) -> None:
+    with _label_cache_lock:
+        _label_cache[key] = label
+        _label_cache.move_to_end(key)
+        while len(_label_cache) > LABEL_CACHE_MAXSIZE:
+            _label_cache.popitem(last=False)
+
+
+async def classify_documents_async(
+    docs: List[IngestedDocument],
+    batch_size: int = BATCH_SIZE,
+    max_concurrency: int = MAX_CONCURRENCY,
+    model_name: Optional[str] = None,
+) -> List[str]:
+    """
+    ใช้ Gemini จำแนกหลายเอกสาร: แบ่ง batch ละ batch_size เอกสาร (1 call ต่อ batch)
+    แล้วยิงทุก batch พร้อมกัน (จำกัดด้วย semaphore = max_concurrency)
+    - เอกสารที่เคย classify แล้ว (ชื่อไฟล์ + เนื้อหาเดิม) → ใช้ผลจาก LRU cache ไม่ยิงซ้ำ
+    - เอกสารที่ Gemini ไม่ตอบ / call พัง → fallback เป็น rule-based ทีละตัว
+    - คืน label ตามลำดับเดิมของ docs
+    """
+    if not docs:
+        return []
+
+    model_name = model_name or GEMINI_MODEL_NAME
+    keys = [_label_cache_key(model_name, d) for d in docs]
+    found: Dict[str, str] = {}
+    for key in keys:
+        label = _label_cache_get(key)
+        if label is not None:
+            found[key] = label
+
+    # ยิง Gemini เฉพาะเอกสารที่ยังไม่มีผล (เอกสารซ้ำกันใน list ยิงครั้งเดียว)
+    pending: Dict[str, IngestedDocument] = {}
+    for key, doc in zip(keys, docs):
+        if key not in found and key not in pending:
+            pending[key] = doc
+
+    if pending:
+        found.update(
+            await _classify_pending(pending, batch_size, max_concurrency, model_name)
+        )
 
-        # normalize
-        answer = answer.replace("label:", "").strip()
+    return [
+        found.get(key) or classify_document_rule_based(doc)
+        for key, doc in zip(keys, docs)
+    ]
 
-        # fuzzy match แบบง่าย ๆ
-        if "bank" in answer and "statement" in answer:
-            return "bank_statement"
-        if "invoice" in answer:
-            return "invoice"
-        if "receipt" in answer:
-            return "receipt"
-        if "purchase" in answer:
-            return "purchase_order"
 
-        return "generic"
+async def _classify_pending(
+    pending: Dict[str, IngestedDocument],
+    batch_size: int,
+    max_concurrency: int,
+    model_name: str,
+) -> Dict[str, str]:
+    """ยิง Gemini ให้เอกสารใน pending (key -> doc) คืนเฉพาะ key ที่ได้ label และเก็บลง cache"""
+    try:
+        if not GEMINI_API_KEY:
+            logger.info("GEMINI_API_KEY not set → fallback")
+            return {}
 
+        model = _get_classifier_model(model_name)
     except Exception as e:
-        print(f"[document_classifier] Gemini classify failed: {e}")
-        print("[document_classifier] Fallback to rule-based")
-        return classify_document_rule_based(doc)
+        logger.warning("Gemini setup failed: %s → fallback to rule-based", e)
+        return {}
+
+    items = list(pending.items())
+    batches = [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _run(batch_no: int, batch) -> Dict[str, str]:
+        parsed: Dict[str, str] = {}
+        try:
+            async with semaphore:
+                resp = await _generate_with_retry(
+                    model, _build_batch_prompt([doc for _, doc in batch])
+                )
+            for idx, label in _parse_batch_answer(resp.text or "", len(batch)).items():
+                parsed[batch[idx - 1][0]] = label
+        except Exception as e:
+            logger.warning("Gemini batch classify failed: %s", e)
+
+        logger.debug("Gemini batch %d: %d/%d labels", batch_no, len(parsed), len(batch))
+        return parsed
+
+    results = await asyncio.gather(
+        *(_run(n, b) for n, b in enumerate(batches, start=1))
+    )
+
+    labels: Dict[str, str] = {}
+    for parsed in results:
+        labels.update(parsed)
+    for key, label in labels.items():
+        _label_cache_put(key, label)
+    return labels
+
+
+def classify_documents_batch(
+    docs: List[IngestedDocument],
+    batch_size: int = BATCH_SIZE,
+    model_name: Optional[str] = None,
+) -> List[str]:
+    """
+    sync wrapper ของ classify_documents_async (สำหรับเรียกจาก pipeline ที่เป็น sync)
+    ส่ง coroutine ไปรันบน loop ถาวร (_get_loop) แล้วรอผล → เรียกซ้ำกี่ครั้งก็ใช้ channel เดิมได้
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        classify_documents_async(docs, batch_size=batch_size, model_name=model_name),
+        _get_loop(),
+    )
+    return future.result()
 
 
 # ============================================================
 # PUBLIC ENTRYPOINT
 # ============================================================
-def classify_document(doc: IngestedDocument, use_gemini: bool = True) -> str:
+def classify_document(
+    doc: IngestedDocument,
+    use_gemini: bool = True,
+    force_llm: bool = False,
+) -> str:
     """
     เลือกว่าจะใช้ rule-based หรือ Gemini
+    - ลอง rule-based ก่อนเสมอ ถ้าได้ label ชัด ๆ (ไม่ใช่ generic) ก็จบเลย ไม่ต้องเสีย LLM call
+    - ได้ generic → ค่อยให้ Gemini ช่วย (force_llm=True → ใช้ Gemini ทุกครั้งแบบเดิม)
     """
     if not use_gemini:
         return classify_document_rule_based(doc)
 
-    # พยายามใช้ Gemini ก่อน
+    if not force_llm:
+        label = classify_document_rule_based(doc)
+        if label != "generic":
+            return label
+
     return classify_document_with_gemini(doc)
 
 
+def classify_documents(
+    docs: List[IngestedDocument],
+    use_gemini: bool = True,
+    force_llm: bool = False,
+) -> List[str]:
+    """
+    จำแนกหลายเอกสารพร้อมกัน (Gemini แบบ batch → ประหยัดจำนวน call)
+    ส่งเข้า Gemini เฉพาะเอกสารที่ rule-based ตอบว่า generic (เว้นแต่ force_llm=True)
+    """
+    if not use_gemini:
+        return [classify_document_rule_based(d) for d in docs]
+
+    if force_llm:
+        return classify_documents_batch(docs)
+
+    labels = [classify_document_rule_based(d) for d in docs]
+    unsure = [i for i, label in enumerate(labels) if label == "generic"]
+    if unsure:
+        llm_labels = classify_documents_batch([docs[i] for i in unsure])
+        for i, label in zip(unsure, llm_labels):
+            labels[i] = label
+    return labels
+
+
 # ============================================================
 # CLI TEST
 # ============================================================
 if __name__ == "__main__":
-    import json
     from pathlib import Path
 
     # ทดสอบโหลดจาก ingested/sample
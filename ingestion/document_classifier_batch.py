@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+"""
+document_classifier_batch.py
+
+จำแนกเอกสารจำนวนมากแบบ offline ผ่าน Gemini Batch API (ราคาถูกกว่า call ปกติ
+และไม่ไปแย่ง rate limit ของ pipeline ออนไลน์)
+
+ขั้นตอน:
+- rule-based ก่อน → ส่งเข้า batch เฉพาะเอกสารที่ได้ generic (เหมือน classify_documents)
+- เขียน request ละ 1 เอกสารลง JSONL (key = doc_id) → upload → สร้าง batch job
+- poll สถานะแบบ exponential backoff จนงานจบ → อ่านผล JSONL แล้ว join กลับด้วย key
+- ไม่มี SDK ใหม่ (google-genai) / batch ใช้ไม่ได้ → fallback เป็น classify_documents
+
+ต้องใช้แพ็กเกจ google-genai (Batch API ไม่มีใน google-generativeai)
+"""
+
+import json
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ingestion.config import GEMINI_API_KEY
+from ingestion.document_classifier import (
+    CANDIDATE_TYPES,
+    GEMINI_MODEL_NAME,
+    _CLASSIFIER_INSTRUCTION,
+    _build_batch_prompt,
+    _label_cache_key,
+    _label_cache_put,
+    _parse_batch_answer,
+    classify_document_rule_based,
+    classify_documents,
+)
+from ingestion.schema import IngestedDocument
+
+try:
+    from google import genai as google_genai
+except ImportError:  # ยังไม่ได้ลง google-genai → ใช้ classify_documents แทน
+    google_genai = None
+
+logger = logging.getLogger(__name__)
+
+POLL_INITIAL_DELAY = 10.0  # วินาที
+POLL_MAX_DELAY = 300.0
+POLL_TIMEOUT = 24 * 3600  # batch job ของ Gemini อาจใช้เวลาได้ถึง 24 ชม.
+
+# generation config แบบเดียวกับ _GENERATION_CONFIG ของ document_classifier
+# แต่เป็น JSON ของ REST API ตรง ๆ (ชื่อ type ใน schema ต้องเป็นตัวใหญ่)
+_REST_GENERATION_CONFIG = {
+    "temperature": 0,
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "ARRAY",
+        "items": {"type": "STRING", "format": "enum", "enum": CANDIDATE_TYPES},
+    },
+}
+
+_DONE_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
+
+
+def _write_requests_jsonl(docs: List[IngestedDocument], path: Path) -> None:
+    """
+    เขียน request ละ 1 เอกสารลงไฟล์ JSONL ตาม format ของ Batch API
+    - key = ลำดับใน docs (ไม่ใช้ doc_id เพราะ doc_id ซ้ำกันได้ → ผลทับกัน)
+    """
+    with path.open("w", encoding="utf-8") as f:
+        for i, doc in enumerate(docs):
+            line = {
+                "key": str(i),
+                "request": {
+                    "system_instruction": {"parts": [{"text": _CLASSIFIER_INSTRUCTION}]},
+                    "contents": [
+                        {"role": "user", "parts": [{"text": _build_batch_prompt([doc])}]}
+                    ],
+                    "generation_config": _REST_GENERATION_CONFIG,
+                },
+            }
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def _wait_for_job(client, job_name: str):
+    """poll สถานะ batch job แบบ exponential backoff จนจบหรือหมดเวลา"""
+    delay = POLL_INITIAL_DELAY
+    deadline = time.monotonic() + POLL_TIMEOUT
+    while True:
+        job = client.batches.get(name=job_name)
+        state = job.state.name if hasattr(job.state, "name") else str(job.state)
+        if state in _DONE_STATES:
+            return job, state
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"batch job {job_name} still {state} after {POLL_TIMEOUT}s")
+        logger.info("job %s: %s → wait %.0fs", job_name, state, delay)
+        time.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+
+def _run_batch_job(docs: List[IngestedDocument], model_name: str) -> Dict[int, str]:
+    """ส่ง docs เข้า Batch API แล้วคืน {ลำดับใน docs: label} เฉพาะตัวที่ได้คำตอบ"""
+    client = google_genai.Client(api_key=GEMINI_API_KEY)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src_path = Path(tmp) / "classify_requests.jsonl"
+        _write_requests_jsonl(docs, src_path)
+        uploaded = client.files.upload(
+            file=str(src_path),
+            config={"display_name": "classify_requests", "mime_type": "jsonl"},
+        )
+
+    job = client.batches.create(
+        model=model_name,
+        src=uploaded.name,
+        config={"display_name": f"classify-{len(docs)}-docs"},
+    )
+    logger.info("submitted %d docs as %s", len(docs), job.name)
+
+    job, state = _wait_for_job(client, job.name)
+    if state != "JOB_STATE_SUCCEEDED":
+        raise RuntimeError(f"batch job {job.name} ended with {state}")
+
+    raw = client.files.download(file=job.dest.file_name)
+    results: Dict[int, str] = {}
+    for line in raw.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        try:
+            text = item["response"]["candidates"][0]["content"]["parts"][0]["text"]
+        except (KeyError, IndexError, TypeError):
+            continue
+        try:
+            idx = int(item["key"])
+        except (KeyError, ValueError, TypeError):
+            continue
+        label = _parse_batch_answer(text, 1).get(1)
+        if label:
+            results[idx] = label
+    return results
+
+
+def classify_documents_bulk(
+    docs: List[IngestedDocument],
+    model_name: Optional[str] = None,
+    force_llm: bool = False,
+) -> List[str]:
+    """
+    จำแนกเอกสารจำนวนมากผ่าน Gemini Batch API (งาน offline เช่น reprocess ทั้ง corpus)
+    คืน label ตามลำดับเดิมของ docs
+    """
+    if not docs:
+        return []
+
+    if google_genai is None or not GEMINI_API_KEY:
+        logger.info("Batch API unavailable → classify_documents")
+        return classify_documents(docs, force_llm=force_llm)
+
+    model_name = model_name or GEMINI_MODEL_NAME
+    labels = [None if force_llm else classify_document_rule_based(d) for d in docs]
+    unsure_idx = [i for i, label in enumerate(labels) if label in (None, "generic")]
+    if not unsure_idx:
+        return labels
+
+    try:
+        by_pos = _run_batch_job([docs[i] for i in unsure_idx], model_name)
+    except Exception as e:
+        logger.warning("Batch job failed: %s → fallback to classify_documents", e)
+        return classify_documents(docs, force_llm=force_llm)
+
+    out: List[str] = list(labels)
+    for pos, i in enumerate(unsure_idx):
+        doc = docs[i]
+        llm_label = by_pos.get(pos)
+        if llm_label:
+            _label_cache_put(_label_cache_key(model_name, doc), llm_label)
+            out[i] = llm_label
+        else:
+            out[i] = classify_document_rule_based(doc)
+    return out
@@ -10,13 +10,118 @@ image_extractor.py
 - แปลงผลลัพธ์เป็น list[ImageBlock] ตาม schema
 """
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, List
 
 import fitz  # PyMuPDF
 
 from .schema import ImageBlock
 
+# จำนวน thread ที่ใช้เขียนไฟล์รูปลงดิสก์
+WRITE_WORKERS = 4
+
+
+def _write_bytes(path: Path, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class _BackgroundWriter:
+    """
+    เขียนไฟล์รูปใน thread pool → decode รูปถัดไปทำซ้อนกับการเขียนดิสก์ได้
+
+    ใช้เป็น context manager แล้วเรียก writer(path, data) แทนการเขียนเอง
+    wait() / ตอนออกจาก with จะรอทุกไฟล์เขียนเสร็จ (และโยน error ถ้ามี)
+    """
+
+    def __init__(self, max_workers: int = WRITE_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures: List[Future] = []
+
+    def __call__(self, path: Path, data: bytes) -> None:
+        self._futures.append(self._pool.submit(_write_bytes, path, data))
+
+    def wait(self) -> None:
+        futures, self._futures = self._futures, []
+        for f in futures:
+            f.result()
+
+    def __enter__(self) -> "_BackgroundWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self._pool.shutdown(wait=True)
+
+
+def _save_image_block(
+    base_image: dict,
+    doc_id: str,
+    page_number: int,
+    img_index: int,
+    image_counter: int,
+    xref: int,
+    image_dir: Path,
+    write: Callable[[Path, bytes], None] = _write_bytes,
+) -> ImageBlock:
+    """
+    เซฟ bytes ของรูป (ผลจาก extract_image) ลงดิสก์ แล้วสร้าง ImageBlock
+
+    write: ฟังก์ชันเขียนไฟล์ (ส่ง _BackgroundWriter มาเพื่อเขียนแบบไม่รอ)
+    """
+    img_bytes: bytes = base_image["image"]
+    img_ext: str = base_image.get("ext", "png")
+    width: int = base_image.get("width", 0)
+    height: int = base_image.get("height", 0)
+
+    img_id = f"img_{image_counter:04d}"
+
+    # ตั้งชื่อไฟล์ เช่น img_p001_001.png
+    filename = f"img_p{page_number:03d}_{img_index:03d}.{img_ext}"
+    file_path_on_disk = image_dir / filename
+
+    # เซฟรูปลงดิสก์
+    write(file_path_on_disk, img_bytes)
+
+    # ในเฟสนี้เรายังไม่รู้ bbox ที่แน่นอนของรูปในหน้า → ให้ bbox=None ไปก่อน
+    return ImageBlock(
+        id=img_id,
+        doc_id=doc_id,
+        page=page_number,
+        file_path=str(file_path_on_disk),
+        caption=None,             # ภายหลังสามารถใช้ Gemini ช่วยเดา caption ได้
+        section=None,
+        category=None,            # เช่น "logo", "chart", "signature" (ภายหลังค่อยใส่)
+        bbox=None,
+        extra={
+            "width": width,
+            "height": height,
+            "xref": xref,
+        },
+    )
+
+
+def _image_block_ref(first: ImageBlock, page_number: int, image_counter: int) -> ImageBlock:
+    """
+    ImageBlock ของรูป (xref) ที่เคยเจอแล้ว เช่น โลโก้ / หัวกระดาษที่ซ้ำทุกหน้า
+    → ชี้ไปไฟล์เดิม ไม่ต้อง decode / เขียนไฟล์ซ้ำ
+    """
+    return ImageBlock(
+        id=f"img_{image_counter:04d}",
+        doc_id=first.doc_id,
+        page=page_number,
+        file_path=first.file_path,
+        caption=None,
+        section=None,
+        category=None,
+        bbox=None,
+        extra={**first.extra, "duplicate_of": first.id},
+    )
+
 
 def extract_images(
     file_path: str | Path,
@@ -39,62 +144,31 @@ def extract_images(
     image_dir = output_root / doc_id / "images"
     image_dir.mkdir(parents=True, exist_ok=True)
 
-    pdf_doc = fitz.open(path)
+    # วนทีละหน้าใน thread นี้ (PyMuPDF ไม่รองรับหลาย thread และ extract_image ไม่ปล่อย GIL)
+    # decode รูปละครั้งต่อ xref (รูปเดียวกันอาจอยู่หลายหน้า) ส่วนการเขียนดิสก์ส่งไป thread อื่น
+    seen: Dict[int, ImageBlock] = {}
     image_blocks: List[ImageBlock] = []
-
-    try:
-        image_counter = 0
-
-        # loop ทุกหน้า
+    image_counter = 0
+    with fitz.open(path) as pdf_doc, _BackgroundWriter() as writer:
         for page_index in range(pdf_doc.page_count):
             page = pdf_doc[page_index]
             page_number = page_index + 1
-
             # get_images(full=True) คืน list ของ image objects ในหน้านั้น
-            images = page.get_images(full=True)
-
-            for img_index, img in enumerate(images, start=1):
+            for img_index, img in enumerate(page.get_images(full=True), start=1):
                 xref = img[0]  # image reference id ใน PDF
-                base_image = pdf_doc.extract_image(xref)
-
-                img_bytes: bytes = base_image["image"]
-                img_ext: str = base_image.get("ext", "png")
-                width: int = base_image.get("width", 0)
-                height: int = base_image.get("height", 0)
-
                 image_counter += 1
-                img_id = f"img_{image_counter:04d}"
-
-                # ตั้งชื่อไฟล์ เช่น img_p001_001.png
-                filename = f"img_p{page_number:03d}_{img_index:03d}.{img_ext}"
-                file_path_on_disk = image_dir / filename
-
-                # เซฟรูปลงดิสก์
-                with open(file_path_on_disk, "wb") as f:
-                    f.write(img_bytes)
-
-                # ในเฟสนี้เรายังไม่รู้ bbox ที่แน่นอนของรูปในหน้า → ให้ bbox=None ไปก่อน
-                image_block = ImageBlock(
-                    id=img_id,
-                    doc_id=doc_id,
-                    page=page_number,
-                    file_path=str(file_path_on_disk),
-                    caption=None,             # ภายหลังสามารถใช้ Gemini ช่วยเดา caption ได้
-                    section=None,
-                    category=None,            # เช่น "logo", "chart", "signature" (ภายหลังค่อยใส่)
-                    bbox=None,
-                    extra={
-                        "width": width,
-                        "height": height,
-                        "xref": xref,
-                    },
+                first = seen.get(xref)
+                if first is not None:
+                    image_blocks.append(_image_block_ref(first, page_number, image_counter))
+                    continue
+                block = _save_image_block(
+                    pdf_doc.extract_image(xref), doc_id, page_number, img_index,
+                    image_counter, xref, image_dir, write=writer,
                 )
-                image_blocks.append(image_block)
-
-        return image_blocks
+                seen[xref] = block
+                image_blocks.append(block)
 
-    finally:
-        pdf_doc.close()
+    return image_blocks
 
 
 if __name__ == "__main__":
@@ -1,55 +1,149 @@
+import asyncio
 import io
+import logging
+import os
+import threading
+from typing import Optional
 import fitz  # PyMuPDF
-from PIL import Image
-import google.generativeai as genai
 from ingestion.config import GOOGLE_API_KEY
 
+logger = logging.getLogger(__name__)
+
+# client + model ของ OCR (สร้างครั้งเดียวต่อ process)
+_gemini = None
+_gemini_lock = threading.Lock()
+
+# event loop ถาวร 1 ตัว (thread แยก) สำหรับยิง OCR แบบ async
+# - client.aio ผูกกับ loop ที่ใช้ครั้งแรก → ต้องยิงบน loop เดิมตลอด
+# - เรียกจากโค้ดที่มี loop รันอยู่แล้ว (เช่น FastAPI) ได้ ไม่ชนแบบ asyncio.run
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # thread ของ loop ไม่ตามไปใน process ลูก → ให้สร้าง loop / client ใหม่เมื่อจำเป็น
+    global _loop, _loop_lock, _gemini, _gemini_lock
+    _loop = None
+    _loop_lock = threading.Lock()
+    _gemini = None
+    _gemini_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="ocr-loop", daemon=True
+            ).start()
+            _loop = loop
+    return _loop
+
+
 def _get_gemini_model():
+    global _gemini
     if not GOOGLE_API_KEY:
         raise ValueError("❌ Missing GOOGLE_API_KEY in config.py")
 
-    client = genai.Client(api_key=GOOGLE_API_KEY)
-    model = client.models.get("gemini-2.0-flash")
-    return client, model
+    with _gemini_lock:
+        if _gemini is None:
+            # import SDK (google-genai) ตอนจะใช้จริง → import โมดูลนี้ (เช่นเพื่อ render หน้า) ไม่ต้องโหลด SDK
+            from google import genai
+
+            client = genai.Client(api_key=GOOGLE_API_KEY)
+            model = client.models.get(model="gemini-2.0-flash")
+            _gemini = (client, model)
+    return _gemini
+
+
+def _image_part(image_bytes):
+    from google.genai import types
+
+    return types.Part.from_bytes(data=image_bytes, mime_type="image/png")
 
 def pdf_page_to_image_bytes(page):
     pix = page.get_pixmap(dpi=200)
     return pix.tobytes("png")
 
+def render_pages(pdf_doc) -> list:
+    """
+    render ทุกหน้าเป็น PNG bytes ทีละหน้า (คืนตามลำดับหน้า)
+
+    ไม่ใช้ thread: PyMuPDF ไม่รองรับหลาย thread (แม้แยก Document กัน)
+    และ get_pixmap ไม่ปล่อย GIL อยู่แล้ว
+    """
+    return [pdf_page_to_image_bytes(page) for page in pdf_doc]
+
 def ocr_page(client, model, image_bytes):
     response = client.models.generate_content(
         model=model.name,
-        contents=[
-            {
-                "mime_type": "image/png",
-                "data": image_bytes
-            }
-        ]
+        contents=[_image_part(image_bytes)]
     )
     return response.text
 
+# จำนวน request OCR ที่ยิงไป Gemini พร้อมกันสูงสุด
+OCR_CONCURRENCY = 8
+
+async def ocr_page_async(client, model, image_bytes, semaphore):
+    """เหมือน ocr_page แต่ใช้ client.aio → ยิงหลายหน้าพร้อมกันได้ (จำกัดด้วย semaphore)"""
+    async with semaphore:
+        response = await client.aio.models.generate_content(
+            model=model.name,
+            contents=[_image_part(image_bytes)]
+        )
+    return response.text
+
 class OCRDocument:
     def __init__(self):
         self.texts = []  # list of {"page": int, "content": str}
 
+async def _ocr_all_pages(client, model, image_bytes_list: list) -> list:
+    """OCR รูปของทุกหน้าพร้อมกัน (คืนข้อความตามลำดับหน้า)"""
+    semaphore = asyncio.Semaphore(OCR_CONCURRENCY)
+    total = len(image_bytes_list)
+
+    async def _one(idx, image_bytes):
+        text = await ocr_page_async(client, model, image_bytes, semaphore)
+        logger.debug("Done page %d/%d", idx + 1, total)
+        return text
+
+    return await asyncio.gather(
+        *[_one(idx, b) for idx, b in enumerate(image_bytes_list)]
+    )
+
+def ocr_images(client, model, image_bytes_list: list) -> list:
+    """
+    เวอร์ชัน sync ของ _ocr_all_pages (คืนข้อความตามลำดับหน้า)
+
+    ส่ง coroutine ไปรันบน loop ถาวร (_get_loop) แล้วรอผล → เรียกได้ทั้งจากโค้ด sync ธรรมดา
+    และจาก thread ที่มี event loop รันอยู่แล้ว
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        _ocr_all_pages(client, model, image_bytes_list), _get_loop()
+    )
+    return future.result()
+
 def ocr_extract_document(pdf_path: str) -> OCRDocument:
     client, model = _get_gemini_model()
 
-    doc = fitz.open(pdf_path)
+    with fitz.open(pdf_path) as doc:
+        logger.info("Total pages: %d", len(doc))
+        image_bytes_list = render_pages(doc)
     result = OCRDocument()
 
-    print(f"[OCR] Total pages: {len(doc)}")
-
-    for idx, page in enumerate(doc):
-        print(f"[OCR] Processing page {idx + 1}/{len(doc)}")
-
-        image_bytes = pdf_page_to_image_bytes(page)
-        text = ocr_page(client, model, image_bytes)
+    # แต่ละหน้าเป็น request อิสระ → รอ network พร้อมกันแทนทีละหน้า
+    texts = ocr_images(client, model, image_bytes_list)
 
+    for idx, text in enumerate(texts):
         result.texts.append({
             "page": idx + 1,
             "content": text
         })
 
-    print("[OCR] Completed")
+    logger.info("Completed")
     return result
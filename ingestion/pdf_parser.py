@@ -38,17 +38,25 @@ def _extract_text_blocks_from_page(
     doc_id: str,
     page_number: int,
     start_index: int = 0,
+    detailed: bool = False,
 ) -> List[TextBlock]:
     """
     ดึง text blocks จากหน้าเดียวของ PDF
-    ใช้ page.get_text("dict") เพื่อได้ทั้ง text + bbox + font size
+
+    ปกติใช้ page.get_text("blocks") → ได้ tuple แบน ๆ (x0, y0, x1, y1, text, block_no, type)
+    เร็วกว่าและสร้าง object น้อยกว่ามาก แต่ไม่มีขนาดฟอนต์ (avg_font_size=None)
+    detailed=True → ใช้ page.get_text("dict") แบบเดิม เพื่อได้ font size ด้วย
 
     :param pdf_page: fitz.Page
     :param doc_id: ไอดีเอกสาร
     :param page_number: เลขหน้า (เริ่ม 1)
     :param start_index: index เริ่มต้นสำหรับ running id
+    :param detailed: ต้องการ avg_font_size หรือไม่
     :return: list[TextBlock]
     """
+    if not detailed:
+        return _extract_text_blocks_fast(pdf_page, doc_id, page_number, start_index)
+
     page_dict = pdf_page.get_text("dict")
     blocks = page_dict.get("blocks", [])
 
@@ -107,11 +115,51 @@ def _extract_text_blocks_from_page(
     return text_blocks
 
 
+def _extract_text_blocks_fast(
+    pdf_page: fitz.Page,
+    doc_id: str,
+    page_number: int,
+    start_index: int = 0,
+) -> List[TextBlock]:
+    """เวอร์ชัน get_text("blocks") ของ _extract_text_blocks_from_page (ไม่มี font size)"""
+    text_blocks: List[TextBlock] = []
+    current_index = start_index
+
+    for x0, y0, x1, y1, text, _block_no, block_type in pdf_page.get_text("blocks"):
+        # block_type 1 = รูปภาพ ข้ามไป
+        if block_type != 0:
+            continue
+
+        # บรรทัดใน block คั่นด้วย \n → รวมเป็นข้อความเดียว (เว้นวรรค) เหมือนแบบ dict
+        content = " ".join(line for line in text.splitlines() if line.strip()).strip()
+        if not content:
+            continue
+
+        current_index += 1
+        text_blocks.append(
+            TextBlock(
+                id=f"txt_{current_index:04d}",
+                doc_id=doc_id,
+                page=page_number,
+                content=content,
+                section=None,
+                category=None,
+                bbox=(float(x0), float(y0), float(x1), float(y1)),
+                extra={
+                    "avg_font_size": None,
+                },
+            )
+        )
+
+    return text_blocks
+
+
 def parse_pdf(
     file_path: str | Path,
     doc_type: str = "generic",
     doc_id: Optional[str] = None,
     source: str = "uploaded",
+    detailed: bool = False,
 ) -> IngestedDocument:
     """
     ฟังก์ชันหลัก: แปลง PDF 1 ไฟล์ -> IngestedDocument (metadata + text blocks)
@@ -123,6 +171,7 @@ def parse_pdf(
     :param doc_type: ประเภทเอกสาร เช่น "bank_statement", "receipt", "invoice"
     :param doc_id: ถ้าไม่ระบุ จะสร้างจากชื่อไฟล์
     :param source: แหล่งที่มา เช่น "uploaded"
+    :param detailed: True → เก็บ avg_font_size ของแต่ละ block (ช้ากว่า)
     :return: IngestedDocument
     """
     path = Path(file_path)
@@ -159,6 +208,7 @@ def parse_pdf(
                 doc_id=doc_id,
                 page_number=page_number,
                 start_index=current_index,
+                detailed=detailed,
             )
             all_text_blocks.extend(page_text_blocks)
             current_index += len(page_text_blocks)
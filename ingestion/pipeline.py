@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+"""
+pipeline.py
+
+อ่าน PDF แบบรอบเดียว (fitz.open ครั้งเดียว) แล้วดึง text + รูป (+ OCR ถ้าต้องการ)
+ไปพร้อมกันทีละหน้า แทนที่จะให้ parse_pdf / extract_images / ocr_extract_document
+ต่างคนต่างเปิดไฟล์และ decode PDF ซ้ำ
+
+- iter_pdf_pages(...) → generator คืนผลทีละหน้า (PageResult) ใช้กับงานที่อยากเขียนผลออก
+  ระหว่างทางโดยไม่ต้องถือทั้งเอกสารไว้ในหน่วยความจำ
+- ingest_pdf(...) → รวมทุกหน้าเป็น IngestedDocument (texts + images) ให้ pipeline เดิมใช้ต่อ
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import fitz  # PyMuPDF
+
+from .image_extractor import _BackgroundWriter, _image_block_ref, _save_image_block
+from .pdf_parser import _extract_text_blocks_from_page, _generate_doc_id
+from .schema import DocumentMetadata, ImageBlock, IngestedDocument, TextBlock
+
+
+@dataclass
+class PageResult:
+    """ผลของ 1 หน้า: text blocks + image blocks (+ รูปทั้งหน้าไว้ OCR ถ้าเปิด enable_ocr)"""
+    page: int
+    texts: List[TextBlock] = field(default_factory=list)
+    images: List[ImageBlock] = field(default_factory=list)
+    page_image: Optional[bytes] = None
+
+
+def iter_pdf_pages(
+    pdf_doc: fitz.Document,
+    doc_id: str,
+    output_root: str | Path = "ingested",
+    enable_images: bool = True,
+    enable_ocr: bool = False,
+    detailed: bool = False,
+) -> Iterator[PageResult]:
+    """
+    วนทุกหน้าของ pdf_doc ที่เปิดไว้แล้ว แล้ว yield PageResult ทีละหน้า
+
+    running id ของ text / image ต่อเนื่องข้ามหน้าเหมือน parse_pdf / extract_images
+    enable_ocr=True → render เฉพาะหน้าที่ไม่มี text layer เป็น PNG ไว้ใน page_image
+    ไฟล์รูปของหน้าที่ yield ออกไปอาจยังเขียนไม่เสร็จ → ครบแน่นอนเมื่อวน generator จบแล้ว
+    """
+    image_dir = Path(output_root) / doc_id / "images"
+    if enable_images:
+        image_dir.mkdir(parents=True, exist_ok=True)
+
+    text_index = 0
+    image_counter = 0
+    # xref -> ImageBlock แรกของรูปนั้น (รูปซ้ำหลายหน้า decode / เขียนไฟล์ครั้งเดียว)
+    seen_images: Dict[int, ImageBlock] = {}
+
+    # เขียนไฟล์รูปใน thread แยก → decode รูปหน้าถัดไปซ้อนกับการเขียนดิสก์ (ไม่รอทีละหน้า)
+    # รอทุกไฟล์ครั้งเดียวตอน generator จบ (หรือถูกปิดกลางทาง) ใน finally
+    with _BackgroundWriter() as writer:
+        try:
+            for page_index in range(pdf_doc.page_count):
+                page = pdf_doc[page_index]
+                page_number = page_index + 1
+                result = PageResult(page=page_number)
+
+                result.texts = _extract_text_blocks_from_page(
+                    pdf_page=page,
+                    doc_id=doc_id,
+                    page_number=page_number,
+                    start_index=text_index,
+                    detailed=detailed,
+                )
+                text_index += len(result.texts)
+
+                if enable_images:
+                    for img_index, img in enumerate(page.get_images(full=True), start=1):
+                        xref = img[0]
+                        image_counter += 1
+                        first = seen_images.get(xref)
+                        if first is not None:
+                            result.images.append(_image_block_ref(first, page_number, image_counter))
+                            continue
+                        block = _save_image_block(
+                            pdf_doc.extract_image(xref),
+                            doc_id,
+                            page_number,
+                            img_index,
+                            image_counter,
+                            xref,
+                            image_dir,
+                            write=writer,
+                        )
+                        seen_images[xref] = block
+                        result.images.append(block)
+
+                # หน้าสแกน (ไม่มี text layer) → เก็บรูปทั้งหน้าไว้ส่ง OCR
+                if enable_ocr and not result.texts:
+                    from .ocr_extractor import pdf_page_to_image_bytes
+
+                    result.page_image = pdf_page_to_image_bytes(page)
+
+                yield result
+        finally:
+            writer.wait()
+
+
+def _ocr_pages(pages: List[PageResult], doc_id: str, start_index: int) -> List[TextBlock]:
+    """OCR หน้าที่มี page_image พร้อมกัน แล้วแปลงผลเป็น TextBlock (extra.source = "ocr")"""
+    from .ocr_extractor import _get_gemini_model, ocr_images
+
+    targets = [p for p in pages if p.page_image is not None]
+    if not targets:
+        return []
+
+    client, model = _get_gemini_model()
+    texts = ocr_images(client, model, [p.page_image for p in targets])
+
+    blocks: List[TextBlock] = []
+    for page, text in zip(targets, texts):
+        content = (text or "").strip()
+        page.page_image = None  # ใช้เสร็จแล้ว ปล่อย bytes ของรูป
+        if not content:
+            continue
+        start_index += 1
+        blocks.append(
+            TextBlock(
+                id=f"txt_{start_index:04d}",
+                doc_id=doc_id,
+                page=page.page,
+                content=content,
+                section=None,
+                category=None,
+                bbox=None,
+                extra={"source": "ocr"},
+            )
+        )
+    return blocks
+
+
+def ingest_pdf(
+    file_path: str | Path,
+    doc_type: str = "generic",
+    doc_id: Optional[str] = None,
+    source: str = "uploaded",
+    output_root: str | Path = "ingested",
+    enable_images: bool = True,
+    enable_ocr: bool = False,
+    detailed: bool = False,
+) -> IngestedDocument:
+    """
+    แปลง PDF 1 ไฟล์ -> IngestedDocument (metadata + texts + images) โดยเปิดไฟล์ครั้งเดียว
+
+    ผลเหมือนเรียก parse_pdf + extract_images ต่อกัน (ตารางยังให้ table_extractor ทำ)
+    enable_ocr=True → หน้าที่ไม่มี text layer จะถูกส่งไป OCR ด้วย Gemini แล้วต่อท้าย texts
+    """
+    path = Path(file_path)
+    if not path.exists():
+        raise FileNotFoundError(f"PDF file not found: {path}")
+
+    if doc_id is None:
+        doc_id = _generate_doc_id(path)
+
+    with fitz.open(path) as pdf_doc:
+        metadata = DocumentMetadata(
+            doc_id=doc_id,
+            file_name=path.name,
+            doc_type=doc_type,
+            page_count=pdf_doc.page_count,
+            ingested_at=datetime.utcnow().isoformat(),
+            source=source,
+        )
+
+        texts: List[TextBlock] = []
+        images: List[ImageBlock] = []
+        ocr_pending: List[PageResult] = []
+
+        for page in iter_pdf_pages(
+            pdf_doc,
+            doc_id,
+            output_root=output_root,
+            enable_images=enable_images,
+            enable_ocr=enable_ocr,
+            detailed=detailed,
+        ):
+            texts.extend(page.texts)
+            images.extend(page.images)
+            if page.page_image is not None:
+                ocr_pending.append(page)
+
+    if ocr_pending:
+        texts.extend(_ocr_pages(ocr_pending, doc_id, start_index=len(texts)))
+
+    return IngestedDocument(
+        metadata=metadata,
+        texts=texts,
+        tables=[],
+        images=images,
+    )
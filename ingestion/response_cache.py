@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+"""
+response_cache.py
+
+cache คำตอบ (ข้อความ) ของ Gemini ลง SQLite ข้าม process
+ใช้กับงาน enrichment ที่ prompt เดิมควรได้ label ชุดเดิมอยู่แล้ว
+เช่น upload / รัน run_all ซ้ำกับเอกสารเดิม → ไม่ต้องยิง Gemini อีก
+
+key = blake2b(model + system_instruction + prompt)
+→ เปลี่ยนโมเดล / label set / คำสั่ง แล้ว key เปลี่ยนเอง ไม่หยิบคำตอบเก่ามาใช้ผิด ๆ
+"""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+# โฟลเดอร์เก็บ cache = <repo>/cache/gemini_responses.sqlite
+ROOT_DIR = Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT_DIR / "cache"
+CACHE_FILE = CACHE_DIR / "gemini_responses.sqlite"
+
+_TABLE = "responses"
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+
+def make_key(model_name: str, system_instruction: Optional[str], prompt: str) -> bytes:
+    raw = f"{model_name}\x00{system_instruction or ''}\x00{prompt}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+
+def _get_conn() -> sqlite3.Connection:
+    """เปิด SQLite ครั้งเดียวต่อ process แล้วใช้ซ้ำ"""
+    global _conn
+    if _conn is None:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(CACHE_FILE), check_same_thread=False)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {_TABLE} (hash BLOB PRIMARY KEY, response TEXT)"
+        )
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def get(key: bytes) -> Optional[str]:
+    with _lock:
+        row = _get_conn().execute(
+            f"SELECT response FROM {_TABLE} WHERE hash = ?", (key,)
+        ).fetchone()
+    return row[0] if row else None
+
+
+def put(key: bytes, response: str) -> None:
+    with _lock:
+        conn = _get_conn()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {_TABLE} (hash, response) VALUES (?, ?)",
+            (key, response),
+        )
+        conn.commit()
+
+
+def get_or_compute(
+    model_name: str,
+    system_instruction: Optional[str],
+    prompt: str,
+    compute: Callable[[], str],
+) -> str:
+    """
+    คืนคำตอบจาก cache ถ้ามี ไม่งั้นเรียก compute() (ยิง Gemini) แล้วเก็บผล
+    คำตอบว่างไม่เก็บ → รอบหน้าได้ลองใหม่
+    """
+    key = make_key(model_name, system_instruction, prompt)
+    cached = get(key)
+    if cached is not None:
+        return cached
+
+    response = compute()
+    if response:
+        put(key, response)
+    return response
@@ -11,65 +11,197 @@ semantic_enricher.py
 5) Mapping Prepare: ดึงรายการ transaction ออกมาในรูปแบบโครงสร้าง
 
 ทำงานได้ทั้งแบบ:
-- rule-based อย่างเดียว (ถ้าไม่มี GOOGLE_API_KEY)
-- ใช้ Gemini ช่วย (ถ้ามี GOOGLE_API_KEY)
+- rule-based อย่างเดียว (ถ้าไม่มี GEMINI_API_KEY)
+- ใช้ Gemini ช่วย (ถ้ามี GEMINI_API_KEY)
 """
 
-from typing import List, Dict, Any, Optional
-import os
+import logging
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import List, Dict, Any, Optional, Set, Tuple
 
+from . import response_cache
+from .config import GEMINI_API_KEY, get_genai
 from .schema import IngestedDocument, TextBlock, TableBlock
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------
 # Helper: Gemini model
 # ---------------------------
 
 GEMINI_MODEL = "models/gemini-2.5-pro"
 
+# จำนวน block สูงสุดที่ส่งให้ Gemini ต่อเอกสาร (เฉพาะ block ที่ rule-based ไม่มั่นใจ)
+MAX_LLM_BLOCKS = 200
+
+# temperature=0 → prompt เดิมได้คำตอบเดิม (label ไม่แกว่ง และ response_cache ใช้ได้เต็มที่)
+_GENERATION_CONFIG = {"temperature": 0}
+
+
+@lru_cache(maxsize=8)
+def _get_gemini_model(system_instruction: Optional[str] = None):
+    """
+    คืนโมเดล Gemini ถ้ามี API KEY; ถ้าไม่มีให้คืน None
+    สร้างครั้งเดียวต่อ system_instruction ต่อ process แล้วใช้ซ้ำ (lru_cache)
 
-def _get_gemini_model():
-    """คืนโมเดล Gemini ถ้ามี API KEY; ถ้าไม่มีให้คืน None"""
-    api_key = os.getenv("GEMINI_API_KEY")
-    print("[DEBUG semantic_enricher] GEMINI_API_KEY prefix:", (api_key or "None")[:10])
+    system_instruction: คำสั่ง + label set ที่คงที่ของแต่ละงาน → เป็น prefix เดิมทุก request
+    (Gemini 2.5 cache prefix ที่ซ้ำให้อัตโนมัติ) ส่วน prompt ต่อ request เหลือแค่ text blocks
+    """
+    api_key = GEMINI_API_KEY
+    logger.debug("GEMINI_API_KEY set: %s", bool(api_key))
     if not api_key:
         return None
     try:
-        import google.generativeai as genai
-
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel(GEMINI_MODEL)
+        return get_genai().GenerativeModel(
+            GEMINI_MODEL,
+            system_instruction=system_instruction,
+            generation_config=_GENERATION_CONFIG,
+        )
     except Exception as e:
-        print("[semantic_enricher] Cannot init Gemini:", e)
+        logger.warning("Cannot init Gemini: %s", e)
         return None
 
 
+def _generate_text(model, system_instruction: str, prompt: str) -> str:
+    """
+    ยิง Gemini แล้วคืนข้อความคำตอบ ผ่าน response_cache
+    → เอกสารเดิม (prompt เดิม + คำสั่งเดิม) ไม่ต้องยิงซ้ำ แม้รันคนละ process
+    """
+    return response_cache.get_or_compute(
+        GEMINI_MODEL,
+        system_instruction,
+        prompt,
+        lambda: model.generate_content(prompt).text or "",
+    )
+
+
 # ===========================
 # 1) SECTION TAGGING
 # ===========================
 
 SECTION_LABELS = ["header", "summary", "transactions", "footer", "other"]
 
+# คำสั่งคงที่ของงาน tag section (ส่งเป็น system_instruction → prefix เดิมทุก request)
+_SECTION_INSTRUCTION = f"""
+You are a document segmenter.
 
-def _guess_section_rule(block: TextBlock) -> str:
+For each numbered text block, assign ONE section label from:
+{SECTION_LABELS}
+
+Format: one line per block, in the form:
+index: label
+"""
+
+
+def _compile_keyword_groups(groups: Dict[str, List[str]]) -> "re.Pattern[str]":
+    """
+    รวม keyword ทุกกลุ่มเป็น regex เดียว (compile ครั้งเดียวตอน import)
+    ห่อด้วย lookahead → เช็คทุกตำแหน่งโดยไม่กินข้อความ keyword ที่ซ้อนกันจึงไม่หลุด
+    ลำดับกลุ่มใน dict = ลำดับความสำคัญ (ตำแหน่งเดียวกันได้กลุ่มแรกที่ match)
+    """
+    alternatives = "|".join(
+        f"(?P<{name}>{'|'.join(re.escape(k) for k in keywords)})"
+        for name, keywords in groups.items()
+    )
+    return re.compile(f"(?=(?:{alternatives}))")
+
+
+def _scan_keyword_groups(pattern: "re.Pattern[str]", text: str) -> Set[str]:
+    """สแกนข้อความ (lowercase แล้ว) รอบเดียว คืนชื่อกลุ่มทั้งหมดที่เจอ"""
+    return {m.lastgroup for m in pattern.finditer(text)}
+
+
+# ตัวคั่นข้อความแต่ละ block ตอนสแกนรวม (ไม่มีใน keyword → match ไม่คร่อมสอง block)
+_SCAN_SEP = "\x00"
+
+
+def _scan_keyword_groups_many(pattern: "re.Pattern[str]", texts: List[str]) -> List[Set[str]]:
+    """
+    เหมือน _scan_keyword_groups แต่ทำกับทุก block ทีเดียว:
+    ต่อข้อความทั้งหมดเป็น buffer เดียว → finditer รอบเดียว แล้ว map ตำแหน่ง match กลับเป็น index ของ block
+    """
+    hits: List[Set[str]] = [set() for _ in texts]
+    if not texts:
+        return hits
+    # starts[i] = ตำแหน่งเริ่มของ block i ใน buffer
+    starts = [0, *accumulate(len(t) + len(_SCAN_SEP) for t in texts[:-1])]
+    for m in pattern.finditer(_SCAN_SEP.join(texts)):
+        hits[bisect_right(starts, m.start()) - 1].add(m.lastgroup)
+    return hits
+
+
+def _lowered_contents(texts: List[TextBlock]) -> Tuple[List[str], List[str]]:
+    """ดึง content ของทุก block ออกมาเป็น list ครั้งเดียว → (stripped, stripped + lowercase)"""
+    stripped = [(b.content or "").strip() for b in texts]
+    return stripped, [t.lower() for t in stripped]
+
+
+_SECTION_KEYWORDS_RE = _compile_keyword_groups(
+    {
+        "summary": ["summary", "สรุป", "overview"],
+        "transactions": [
+            "รายการเดินบัญชี", "transaction", "movement",
+            "รายการ", "รายละเอียดบัญชี", "statement",
+        ],
+        "footer": ["ลงชื่อ", "ผู้มีอำนาจลงนาม", "ขอแสดงความนับถือ", "signature"],
+    }
+)
+
+
+# บรรทัด "index: label" หรือ "[index]: label" (label = ทุกอย่างหลัง ":" ตัวแรก)
+_INDEXED_ANSWER_RE = re.compile(r"^[ \t]*\[*[ \t]*([+-]?\d+)[ \t]*\]*[ \t]*:(.*)$", re.MULTILINE)
+
+
+def _parse_indexed_answer(text: str) -> Dict[int, str]:
+    """
+    แปลงคำตอบของ Gemini แบบบรรทัดละ "index: label" → {index: label (lowercase)}
+    สแกนทั้งคำตอบด้วย regex รอบเดียว บรรทัดที่อ่านไม่ออกข้ามไป
+    """
+    return {
+        int(m.group(1)): m.group(2).strip().lower()
+        for m in _INDEXED_ANSWER_RE.finditer(text)
+    }
+
+
+def _section_rule_with_confidence(block: TextBlock) -> Tuple[str, bool]:
     """
     rule-based แบบง่าย ๆ พอให้มี section ใช้งาน
     (ไม่ใช้ page_index/bbox เพราะ schema ไม่ได้การันตีว่ามี field นี้)
+
+    คืน (label, มั่นใจไหม) → มั่นใจ = เจอ keyword ของ label เดียวพอดี
+    ไม่เจอเลย (other) หรือเจอหลายกลุ่มปนกัน → ไม่มั่นใจ ควรส่งให้ Gemini ตัดสิน
     """
-    txt = (block.content or "").lower()
+    hits = _scan_keyword_groups(_SECTION_KEYWORDS_RE, (block.content or "").lower())
+    return _section_from_hits(hits)
+
+
+def _section_from_hits(hits: Set[str]) -> Tuple[str, bool]:
+    """ตัดสิน section จากกลุ่ม keyword ที่เจอ (ใช้ร่วมกับการสแกนทีละ block / ทั้งเอกสาร)"""
+    for label in ("summary", "transactions", "footer"):
+        if label in hits:
+            return label, len(hits) == 1
 
-    if any(k in txt for k in ["summary", "สรุป", "overview"]):
-        return "summary"
+    return "other", False
 
-    if any(k in txt for k in ["รายการเดินบัญชี", "transaction", "movement"]):
-        return "transactions"
 
-    if any(k in txt for k in ["รายการ", "รายละเอียดบัญชี", "statement"]):
-        return "transactions"
+def _guess_section_rule(block: TextBlock) -> str:
+    return _section_rule_with_confidence(block)[0]
+
+
+def _gemini_enabled(use_gemini: bool) -> bool:
+    """
+    ขอใช้ Gemini และมี KEY (อ่านจาก config ครั้งเดียวตอน import)
+    ไม่มี KEY → ข้ามการหา block ที่ไม่มั่นใจ / สร้าง prompt ไปเลย
+    """
+    return use_gemini and bool(GEMINI_API_KEY)
 
-    if any(k in txt for k in ["ลงชื่อ", "ผู้มีอำนาจลงนาม", "ขอแสดงความนับถือ", "signature"]):
-        return "footer"
 
-    return "other"
+def _unsure_indices(confident: List[bool]) -> List[int]:
+    """index ของ block ที่ rule-based ไม่มั่นใจ (ไม่เกิน MAX_LLM_BLOCKS ตัวแรก) → ส่งให้ Gemini"""
+    return [i for i, ok in enumerate(confident) if not ok][:MAX_LLM_BLOCKS]
 
 
 def tag_sections(
@@ -78,67 +210,41 @@ def tag_sections(
 ) -> IngestedDocument:
     """
     ใส่ section label ลงใน TextBlock.extra["section"]
-    ถ้า use_gemini=True + มี GOOGLE_API_KEY → ใช้ LLM ช่วย
-    ถ้า error หรือไม่มี KEY → fallback เป็น rule-based (_guess_section_rule)
+    rule-based ก่อนทุก block → ถ้า use_gemini=True + มี GEMINI_API_KEY
+    ส่งให้ LLM เฉพาะ block ที่ rule-based ไม่มั่นใจ
+    ถ้า error หรือไม่มี KEY → ใช้ผล rule-based (_guess_section_rule)
     """
+    _, lowered = _lowered_contents(doc.texts)
+    rule = [
+        _section_from_hits(hits)
+        for hits in _scan_keyword_groups_many(_SECTION_KEYWORDS_RE, lowered)
+    ]
+    mapping: Dict[int, str] = {}
 
-    model = _get_gemini_model() if use_gemini else None
+    unsure = _unsure_indices([ok for _, ok in rule]) if _gemini_enabled(use_gemini) else []
+    model = _get_gemini_model(_SECTION_INSTRUCTION) if unsure else None
 
     if model:
-        # ทำทีละก้อนใหญ่ ให้โมเดลช่วย tag section เฉพาะบาง block แรก
-        joined = []
-        for i, b in enumerate(doc.texts):
-            joined.append(f"[{i}] {b.content}")
-        prompt_text = "\n".join(joined[:200])  # limit 200 blocks แรก
-
-        prompt = f"""
-You are a document segmenter.
-
-For each numbered text block below, assign ONE section label from:
-{SECTION_LABELS}
-
-Format: one line per block, in the form:
-index: label
-
-Text blocks:
-{prompt_text}
-"""
+        prompt_text = "\n".join(f"[{i}] {doc.texts[i].content}" for i in unsure)
+        prompt = f"Text blocks:\n{prompt_text}\n"
 
         try:
-            resp = model.generate_content(prompt)
-            mapping: Dict[int, str] = {}
-            for line in (resp.text or "").splitlines():
-                line = line.strip()
-                if not line or ":" not in line:
-                    continue
-                idx_str, label = line.split(":", 1)
-                idx_str = idx_str.strip().strip("[]")
-                label = label.strip().lower()
-                try:
-                    idx = int(idx_str)
-                except ValueError:
-                    continue
-                if label not in SECTION_LABELS:
-                    label = "other"
-                mapping[idx] = label
-
-            # apply mapping + fallback rule-based ที่ไม่มีใน mapping
-            for i, b in enumerate(doc.texts):
-                extra = dict(b.extra or {})
-                extra["section"] = mapping.get(i, _guess_section_rule(b))
-                b.extra = extra
-
-            return doc
+            answer = _generate_text(model, _SECTION_INSTRUCTION, prompt)
+            sent = set(unsure)
+            mapping = {
+                idx: label if label in SECTION_LABELS else "other"
+                for idx, label in _parse_indexed_answer(answer).items()
+                if idx in sent
+            }
 
         except Exception as e:
-            print("[semantic_enricher] Gemini section tagging failed:", e)
-            print("[semantic_enricher] Fallback to rule-based tagging")
+            logger.warning("Gemini section tagging failed: %s → fallback to rule-based tagging", e)
 
-    # fallback: rule-based ทั้งหมด
-    for b in doc.texts:
-        extra = dict(b.extra or {})
-        extra["section"] = _guess_section_rule(b)
-        b.extra = extra
+    # apply mapping + ผล rule-based ของ block ที่ไม่มีใน mapping
+    for i, (b, (label, _)) in enumerate(zip(doc.texts, rule)):
+        if b.extra is None:
+            b.extra = {}
+        b.extra["section"] = mapping.get(i, label)
 
     return doc
 
@@ -157,33 +263,64 @@ TEXT_ROLE_LABELS = [
     "other",
 ]
 
+_TEXT_ROLE_INSTRUCTION = f"""
+You are a document text role classifier for bank/financial PDFs.
 
-def _guess_text_role_rule(block: TextBlock) -> str:
-    txt = (block.content or "").strip()
-    lower = txt.lower()
+For each text block, assign ONE role from:
+{TEXT_ROLE_LABELS}
 
-    # title: ตัวใหญ่, มีคำพวก statement, report
-    if len(txt) < 80 and any(k in lower for k in ["statement", "รายงาน", "account statement"]):
-        return "title"
+Format: one line per block:
+index: role
+"""
+
+_TEXT_ROLE_KEYWORDS_RE = _compile_keyword_groups(
+    {
+        "title": ["account statement", "statement", "รายงาน"],
+        "account_info": ["เลขที่บัญชี", "account number", "account no", "branch", "ธนาคาร"],
+        "transaction_header": ["วันที่", "วันเดือนปี", "transaction", "ยอดคงเหลือ", "จำนวนเงิน"],
+        "note": ["หมายเหตุ", "note:", "หมาย เหตุ"],
+        "footer_text": ["ลงชื่อ", "ผู้มีอำนาจลงนาม", "ขอแสดงความนับถือ"],
+    }
+)
 
-    if any(k in lower for k in ["เลขที่บัญชี", "account no", "account number", "branch", "ธนาคาร"]):
-        return "account_info"
 
-    if any(k in lower for k in ["วันที่", "วันเดือนปี", "transaction", "ยอดคงเหลือ", "จำนวนเงิน"]):
-        return "transaction_header"
+def _text_role_rule_with_confidence(
+    block: TextBlock,
+    section: Optional[str] = None,
+) -> Tuple[str, bool]:
+    """
+    คืน (role, มั่นใจไหม) แบบเดียวกับ _section_rule_with_confidence
+    section: ถ้าไม่ส่งมา ใช้ block.extra["section"]
+    role ที่มาจาก heuristic (transaction_row) หรือ other → ไม่มั่นใจ
+    """
+    txt = (block.content or "").strip()
+    hits = _scan_keyword_groups(_TEXT_ROLE_KEYWORDS_RE, txt.lower())
+    if section is None:
+        section = (block.extra or {}).get("section")
+    return _text_role_from_hits(hits, txt, section)
+
 
-    if any(k in lower for k in ["หมายเหตุ", "note:", "หมาย เหตุ"]):
-        return "note"
+def _text_role_from_hits(hits: Set[str], txt: str, section: Optional[str]) -> Tuple[str, bool]:
+    """ตัดสิน role จากกลุ่ม keyword ที่เจอ + ความยาวข้อความ (strip แล้ว) + section ของ block"""
+    # title: ตัวใหญ่, มีคำพวก statement, report
+    if len(txt) >= 80:
+        hits = hits - {"title"}
+    if "title" in hits:
+        return "title", len(hits) == 1
 
-    if any(k in lower for k in ["ลงชื่อ", "ผู้มีอำนาจลงนาม", "ขอแสดงความนับถือ"]):
-        return "footer_text"
+    for label in ("account_info", "transaction_header", "note", "footer_text"):
+        if label in hits:
+            return label, len(hits) == 1
 
     # heuristic: block อยู่ใน section=transactions และความยาวปานกลาง
-    section = (block.extra or {}).get("section")
     if section == "transactions" and 10 <= len(txt) <= 200:
-        return "transaction_row"
+        return "transaction_row", False
+
+    return "other", False
 
-    return "other"
+
+def _guess_text_role_rule(block: TextBlock) -> str:
+    return _text_role_rule_with_confidence(block)[0]
 
 
 def categorize_text_blocks(
@@ -199,65 +336,126 @@ def categorize_text_blocks(
     - note
     - footer_text
     - other
+
+    rule-based ก่อน แล้วส่งให้ Gemini เฉพาะ block ที่ rule-based ไม่มั่นใจ
     """
+    stripped, lowered = _lowered_contents(doc.texts)
+    rule = [
+        _text_role_from_hits(hits, txt, (b.extra or {}).get("section"))
+        for b, txt, hits in zip(
+            doc.texts, stripped, _scan_keyword_groups_many(_TEXT_ROLE_KEYWORDS_RE, lowered)
+        )
+    ]
+    mapping: Dict[int, str] = {}
 
-    model = _get_gemini_model() if use_gemini else None
+    unsure = _unsure_indices([ok for _, ok in rule]) if _gemini_enabled(use_gemini) else []
+    model = _get_gemini_model(_TEXT_ROLE_INSTRUCTION) if unsure else None
 
     if model:
         # ส่งเฉพาะ subset ไปให้โมเดลช่วย classify
         joined = []
-        for i, b in enumerate(doc.texts[:200]):
+        for i in unsure:
+            b = doc.texts[i]
             section = (b.extra or {}).get("section", "unknown")
             joined.append(f"[{i}] (section={section}) {b.content}")
         prompt_text = "\n".join(joined)
 
-        prompt = f"""
-You are a document text role classifier for bank/financial PDFs.
+        prompt = f"Text blocks:\n{prompt_text}\n"
 
-For each text block, assign ONE role from:
-{TEXT_ROLE_LABELS}
+        try:
+            answer = _generate_text(model, _TEXT_ROLE_INSTRUCTION, prompt)
+            sent = set(unsure)
+            mapping = {
+                idx: label if label in TEXT_ROLE_LABELS else "other"
+                for idx, label in _parse_indexed_answer(answer).items()
+                if idx in sent
+            }
+
+        except Exception as e:
+            logger.warning("Gemini text role tagging failed: %s → fallback to rule-based text role", e)
+
+    for i, (b, (label, _)) in enumerate(zip(doc.texts, rule)):
+        if b.extra is None:
+            b.extra = {}
+        b.extra["role"] = mapping.get(i, label)
+
+    return doc
 
-Format: one line per block:
-index: role
 
-Text blocks:
-{prompt_text}
+# ===========================
+# 3) SECTION + TEXT ROLE (Gemini call เดียว)
+# ===========================
+
+_SECTION_ROLE_INSTRUCTION = f"""
+You are a document segmenter and text role classifier for bank/financial PDFs.
+
+For each numbered text block, assign:
+- ONE section label from: {SECTION_LABELS}
+- ONE role label from: {TEXT_ROLE_LABELS}
+
+Format: one line per block, in the form:
+index: section, role
 """
 
-        try:
-            resp = model.generate_content(prompt)
-            mapping: Dict[int, str] = {}
-            for line in (resp.text or "").splitlines():
-                line = line.strip()
-                if not line or ":" not in line:
-                    continue
-                idx_str, label = line.split(":", 1)
-                idx_str = idx_str.strip().strip("[]")
-                label = label.strip().lower()
-                try:
-                    idx = int(idx_str)
-                except ValueError:
-                    continue
-                if label not in TEXT_ROLE_LABELS:
-                    label = "other"
-                mapping[idx] = label
 
-            for i, b in enumerate(doc.texts):
-                extra = dict(b.extra or {})
-                extra["role"] = mapping.get(i, _guess_text_role_rule(b))
-                b.extra = extra
+def tag_sections_and_roles(
+    doc: IngestedDocument,
+    use_gemini: bool = False,
+) -> IngestedDocument:
+    """
+    ใส่ทั้ง TextBlock.extra["section"] และ extra["role"] ในรอบเดียว
+    ใช้ Gemini แค่ 1 request ต่อเอกสาร (แทน tag_sections + categorize_text_blocks ที่ยิงคนละรอบ)
+    → คำสั่ง / label set ส่งครั้งเดียว ไม่ต้องส่งข้อความ block ซ้ำสองรอบ
+
+    ส่งให้ Gemini เฉพาะ block ที่ rule-based ไม่มั่นใจ section หรือ role อย่างใดอย่างหนึ่ง
+    block ที่ Gemini ไม่ได้ตอบ (หรือ error / ไม่มี KEY) → ใช้ rule-based
+    role ของ rule-based ใช้ section ที่ได้ในรอบเดียวกันนี้
+    """
+    sections: Dict[int, str] = {}
+    roles: Dict[int, str] = {}
+
+    # สแกน keyword ของทั้งเอกสารครั้งเดียว แล้วใช้ hits ชุดเดิมทั้งตอนเช็คความมั่นใจและตอนเขียนผล
+    stripped, lowered = _lowered_contents(doc.texts)
+    section_hits = _scan_keyword_groups_many(_SECTION_KEYWORDS_RE, lowered)
+    role_hits = _scan_keyword_groups_many(_TEXT_ROLE_KEYWORDS_RE, lowered)
+    rule_sections = [_section_from_hits(h) for h in section_hits]
+
+    # ความมั่นใจของ rule ใช้แค่เลือก block ส่ง Gemini → ไม่ใช้ Gemini ก็ไม่ต้องคำนวณ
+    unsure: List[int] = []
+    if _gemini_enabled(use_gemini):
+        confident = []
+        for (section, section_ok), txt, hits in zip(rule_sections, stripped, role_hits):
+            _, role_ok = _text_role_from_hits(hits, txt, section)
+            confident.append(section_ok and role_ok)
+        unsure = _unsure_indices(confident)
+    model = _get_gemini_model(_SECTION_ROLE_INSTRUCTION) if unsure else None
+
+    if model:
+        prompt_text = "\n".join(f"[{i}] {doc.texts[i].content}" for i in unsure)
+        prompt = f"Text blocks:\n{prompt_text}\n"
 
-            return doc
+        try:
+            text = _generate_text(model, _SECTION_ROLE_INSTRUCTION, prompt)
+            sent = set(unsure)
+            for idx, answer in _parse_indexed_answer(text).items():
+                if idx not in sent:
+                    continue
+                section, _, role = answer.partition(",")
+                section, role = section.strip(), role.strip()
+                sections[idx] = section if section in SECTION_LABELS else "other"
+                if role:
+                    roles[idx] = role if role in TEXT_ROLE_LABELS else "other"
 
         except Exception as e:
-            print("[semantic_enricher] Gemini text role tagging failed:", e)
-            print("[semantic_enricher] Fallback to rule-based text role")
+            logger.warning("Gemini section/role tagging failed: %s → fallback to rule-based", e)
 
-    # fallback rule-based
-    for b in doc.texts:
-        extra = dict(b.extra or {})
-        extra["role"] = _guess_text_role_rule(b)
-        b.extra = extra
+    for i, b in enumerate(doc.texts):
+        if b.extra is None:
+            b.extra = {}
+        section = sections.get(i) or rule_sections[i][0]
+        b.extra["section"] = section
+        # rule ของ role ใช้ section สุดท้าย (อาจมาจาก Gemini) ประกอบ
+        b.extra["role"] = roles.get(i) or _text_role_from_hits(role_hits[i], stripped[i], section)[0]
 
     return doc
 
@@ -296,30 +494,61 @@ HEADER_NORMALIZATION_MAP = {
 }
 
 
+# key ทั้งหมดรวมเป็น regex เดียว (ห่อ lookahead → เจอ key ที่ซ้อนกันครบทุกตำแหน่ง)
+# เรียง alternation ตามลำดับใน map → แต่ละตำแหน่งได้ key ที่มาก่อนใน map เสมอ
+_HEADER_KEY_PRIORITY = {key: i for i, key in enumerate(HEADER_NORMALIZATION_MAP)}
+_HEADER_KEYS_RE = re.compile(
+    "(?=(" + "|".join(re.escape(k) for k in HEADER_NORMALIZATION_MAP) + "))"
+)
+
+
+@lru_cache(maxsize=4096)
 def _normalize_header_name(h: str) -> str:
-    """normalize header ชื่อ → canonical name ถ้าเจอ"""
+    """
+    normalize header ชื่อ → canonical name ถ้าเจอ
+    ผลเหมือนวน map หา key แรกที่เป็น substring แต่สแกน header รอบเดียว
+    (header ซ้ำ ๆ ข้ามตาราง / หน้า → ได้จาก lru_cache เลย)
+    """
     h_clean = (h or "").strip().lower()
     if not h_clean:
         return ""
-    for key, canonical in HEADER_NORMALIZATION_MAP.items():
-        if key in h_clean:
-            return canonical
-    return h_clean
+    key = min(
+        (m.group(1) for m in _HEADER_KEYS_RE.finditer(h_clean)),
+        key=_HEADER_KEY_PRIORITY.__getitem__,
+        default=None,
+    )
+    return HEADER_NORMALIZATION_MAP[key] if key is not None else h_clean
 
 
 TABLE_ROLE_LABELS = ["transaction_table", "summary_table", "other_table"]
 
 
+_TABLE_ROLE_KEYWORDS_RE = _compile_keyword_groups(
+    {
+        "date": ["date"],
+        "amount": ["amount", "ยอดเงิน", "debit", "credit", "ยอดคงเหลือ", "balance"],
+        "summary": ["summary", "สรุป", "total", "รวม"],
+    }
+)
+
+
 def _guess_table_role(tb: TableBlock) -> str:
     header = getattr(tb, "header", []) or []
-    header_lower = [str(h).lower() for h in header]
+    return _table_role_for_header(tuple(str(h) for h in header))
 
-    if any("date" in h for h in header_lower) and any(
-        x in h for h in header_lower for x in ["amount", "ยอดเงิน", "debit", "credit", "ยอดคงเหลือ", "balance"]
-    ):
+
+@lru_cache(maxsize=1024)
+def _table_role_for_header(header: Tuple[str, ...]) -> str:
+    """
+    role ของตารางจาก header (ตารางต่อหลายหน้ามัก header ชุดเดียวกัน → ได้จาก lru_cache เลย)
+    """
+    # คั่น header ด้วย \n → keyword ไม่มี \n จึงไม่ match คร่อมสอง column
+    hits = _scan_keyword_groups(_TABLE_ROLE_KEYWORDS_RE, "\n".join(header).lower())
+
+    if "date" in hits and "amount" in hits:
         return "transaction_table"
 
-    if any(k in " ".join(header_lower) for k in ["summary", "สรุป", "total", "รวม"]):
+    if "summary" in hits:
         return "summary_table"
 
     return "other_table"
@@ -341,19 +570,18 @@ def normalize_tables(tables: List[TableBlock]) -> List[TableBlock]:
 
         tb.header = normalized_header
 
-        extra = dict(tb.extra or {})
-        extra_norm = extra.get("header_normalization", {})
-        extra_norm.update(
+        # แก้ extra ของ block เดิมตรง ๆ (ไม่ copy dict ใหม่ทุก block)
+        if tb.extra is None:
+            tb.extra = {}
+        tb.extra.setdefault("header_normalization", {}).update(
             {
                 "original_header": header,
                 "normalized_header": normalized_header,
             }
         )
-        extra["header_normalization"] = extra_norm
 
         # ใส่ role ให้ table ด้วย
-        extra["role"] = _guess_table_role(tb)
-        tb.extra = extra
+        tb.extra["role"] = _guess_table_role(tb)
 
     return tables
 
@@ -362,17 +590,16 @@ def normalize_tables(tables: List[TableBlock]) -> List[TableBlock]:
 # 5) MAPPING PREPARE
 # ===========================
 
-from typing import Optional
-
-
-def _parse_float_safe(val: Optional[str]) -> Optional[float]:
-    if val is None:
-        return None
-    s = str(val).replace(",", "").strip()
-    try:
-        return float(s)
-    except ValueError:
-        return None
+# column canonical ที่ดึงออกมาเป็น transaction + ชื่อ key ของค่าดิบใน record
+_TX_RAW_KEYS = {
+    "date": "date_raw",
+    "description": "description",
+    "amount_in": "amount_in_raw",
+    "amount_out": "amount_out_raw",
+    "amount": "amount_raw",
+    "balance": "balance_raw",
+}
+_TX_NUMERIC_COLS = ("amount_in", "amount_out", "amount", "balance")
 
 
 def extract_transactions_from_table(tb: TableBlock) -> List[Dict[str, Any]]:
@@ -380,53 +607,61 @@ def extract_transactions_from_table(tb: TableBlock) -> List[Dict[str, Any]]:
     พยายาม map ตารางให้กลายเป็น transaction records:
     - หา column index ของ date / description / amount / amount_in / amount_out / balance
     - คืน list ของ dict ที่มี key เหล่านี้
+
+    ทำทั้งตารางเป็น DataFrame ทีเดียว (strip / ตัด comma / แปลงตัวเลขทำทีละ column ใน C)
+    แทนการวนทีละแถวใน Python
     """
     header = getattr(tb, "header", [])
     rows = getattr(tb, "rows", [])
+    if not rows:
+        return []
+
+    # pandas import ช้า → โหลดเมื่อมีตารางให้แปลงจริงเท่านั้น
+    import pandas as pd
 
-    # map header → index
+    # map header → index (ชื่อซ้ำ → ใช้ column หลังสุด เหมือนเดิม)
     name_to_idx: Dict[str, int] = {}
     for i, h in enumerate(header):
         if not h:
             continue
         name_to_idx[h] = i
 
-    records: List[Dict[str, Any]] = []
+    # แถวยาวไม่เท่ากัน → DataFrame เติมช่องที่ขาดเป็น NaN/None ให้เอง
+    df = pd.DataFrame(rows)
+    empty = pd.Series([None] * len(df), index=df.index, dtype=object)
 
-    for row in rows:
-        def col(name: str) -> Optional[str]:
-            idx = name_to_idx.get(name)
-            if idx is None or idx >= len(row):
-                return None
-            return str(row[idx]).strip()
-
-        date = col("date")
-        desc = col("description")
-
-        amount_in = col("amount_in")
-        amount_out = col("amount_out")
-        amount = col("amount")
-        balance = col("balance")
-
-        if not any([date, desc, amount_in, amount_out, amount, balance]):
+    raw: Dict[str, pd.Series] = {}
+    for name in _TX_RAW_KEYS:
+        idx = name_to_idx.get(name)
+        if idx is None or idx >= df.shape[1]:
+            raw[name] = empty
             continue
-
-        record: Dict[str, Any] = {
-            "date_raw": date,
-            "description": desc,
-            "amount_in_raw": amount_in,
-            "amount_out_raw": amount_out,
-            "amount_raw": amount,
-            "balance_raw": balance,
-            "amount_in": _parse_float_safe(amount_in) if amount_in else None,
-            "amount_out": _parse_float_safe(amount_out) if amount_out else None,
-            "amount": _parse_float_safe(amount) if amount else None,
-            "balance": _parse_float_safe(balance) if balance else None,
-        }
-
-        records.append(record)
-
-    return records
+        # astype(object) → column ที่เป็น NaN ล้วนก็ยังใช้ .str ได้
+        raw[name] = df[idx].map(str, na_action="ignore").astype(object).str.strip()
+
+    # แถวที่ทุก column ว่าง (None หรือ "") → ข้าม
+    raw_df = pd.DataFrame(raw)
+    keep = (raw_df.notna() & (raw_df != "")).any(axis=1)
+    raw_df = raw_df[keep]
+    if raw_df.empty:
+        return []
+
+    out = raw_df.rename(columns=_TX_RAW_KEYS)
+
+    # ต่อ column ตัวเลขทั้ง 4 เป็น Series เดียว → ตัด comma / แปลงตัวเลขรอบเดียวทั้งตาราง
+    # (แทนการเรียก .str / to_numeric แยกทีละ column)
+    n = len(raw_df)
+    stacked = pd.concat([raw_df[name] for name in _TX_NUMERIC_COLS], ignore_index=True)
+    parsed = pd.to_numeric(
+        stacked.str.replace(",", "", regex=False).str.strip(),
+        errors="coerce",
+    ).to_numpy()
+    for k, name in enumerate(_TX_NUMERIC_COLS):
+        out[name] = parsed[k * n:(k + 1) * n]
+
+    # NaN → None ให้ได้ dict แบบเดิม (ค่าว่าง / แปลงไม่ได้ = None)
+    out = out.astype(object).where(out.notna(), None)
+    return out.to_dict(orient="records")
 
 
 def prepare_mapping_payload(doc: IngestedDocument) -> Dict[str, Any]:
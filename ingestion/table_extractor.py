@@ -9,14 +9,22 @@ table_extractor.py
 - คืนค่า list[TableBlock] เพื่อไปใส่ใน IngestedDocument.tables ภายหลัง
 """
 
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Any
+from typing import TYPE_CHECKING, List, Optional, Any, Tuple
 
-import camelot
-import pandas as pd
+import fitz  # PyMuPDF (ใช้นับจำนวนหน้า)
 
 from .schema import TableBlock, BBox
 
+# camelot / pandas import ช้า → import ในฟังก์ชันที่ใช้จริง (import โมดูลนี้เฉย ๆ ไม่ต้องจ่าย)
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
 
 def _guess_table_category(df: pd.DataFrame) -> str:
     """
@@ -47,34 +55,116 @@ def _dataframe_to_columns_rows(df: pd.DataFrame) -> tuple[list[str], list[list[A
     แปลง DataFrame ที่ Camelot คืนมาให้เป็น (columns, rows)
     โดยสมมติว่า row แรกคือ header
     """
-    # แปลงทุก cell เป็น string ก่อน เพื่อความสม่ำเสมอ
-    df_str = df.astype(str)
+    import pandas as pd
 
-    # สมมติว่า row แรกคือ header
-    header = df_str.iloc[0].tolist()
-    data_rows = df_str.iloc[1:].values.tolist()
+    # ทุก cell ต้องเป็น string เพื่อความสม่ำเสมอ
+    # DataFrame ของ Camelot เป็น string อยู่แล้ว → ดึง array ตรง ๆ ไม่ต้อง astype(str) ทั้งตาราง
+    if all(pd.api.types.is_string_dtype(df[c]) for c in df.columns):
+        arr = df.to_numpy(dtype=object, copy=False)
+    else:
+        arr = df.astype(str).to_numpy()
 
+    # สมมติว่า row แรกคือ header
     # ลบ header ที่ว่างเปล่าบางส่วน
-    header = [h.strip() for h in header]
+    header = [h.strip() for h in arr[0].tolist()]
+    data_rows = arr[1:].tolist()
 
     return header, data_rows
 
 
+# จำนวน process ที่ใช้อ่านตารางพร้อมกัน (Camelot / pdfminer กิน CPU ล้วน ๆ → แยก process)
+TABLE_WORKERS = os.cpu_count() or 4
+
+
+def _expand_pages(pages: str, page_count: int) -> List[int]:
+    """
+    แปลง pages แบบ Camelot ("all", "1", "1,3", "2-4", "3-end") → list เลขหน้า (เริ่ม 1)
+    """
+    if pages.strip().lower() == "all":
+        return list(range(1, page_count + 1))
+
+    result: List[int] = []
+    for part in pages.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            last = page_count if end.strip().lower() == "end" else int(end)
+            result.extend(range(int(start), min(last, page_count) + 1))
+        else:
+            result.append(int(part))
+    return [p for p in dict.fromkeys(result) if 1 <= p <= page_count]
+
+
+def _extract_one_page(args: Tuple[str, int, str]) -> List[dict]:
+    """
+    worker (ระดับ module → pickle ส่งเข้า process ได้): อ่านตารางของหน้าเดียวด้วย flavor เดียว
+    คืนเป็น dict ธรรมดา (columns / rows / category / bbox / ...) ไม่ต้อง pickle object ของ Camelot
+    """
+    import camelot
+
+    path, page, flavor = args
+
+    try:
+        tables = camelot.read_pdf(path, pages=str(page), flavor=flavor)
+    except Exception as e:
+        # ถ้า flavor นี้ใช้ไม่ได้ (เช่น หน้านี้ไม่มีเส้นตารางสำหรับ lattice) → ถือว่าไม่เจอตาราง
+        logger.debug("Error using flavor='%s' on page %d: %s", flavor, page, e)
+        return []
+
+    results = []
+    for t in tables:
+        df: pd.DataFrame = t.df
+
+        # แปลง DataFrame -> columns, rows
+        columns, rows = _dataframe_to_columns_rows(df)
+
+        # พยายามดึง bbox ถ้ามี (บาง version ของ Camelot มี attribute _bbox)
+        bbox: Optional[BBox] = None
+        if hasattr(t, "_bbox") and t._bbox is not None:
+            x1, y1, x2, y2 = t._bbox
+            bbox = (float(x1), float(y1), float(x2), float(y2))
+
+        results.append(
+            {
+                "page": t.page,              # page index ที่ Camelot แยกได้
+                "columns": columns,
+                "rows": rows,
+                "category": _guess_table_category(df),  # เดาจาก header / columns
+                "bbox": bbox,
+                "flavor": flavor,
+                "parsing_report": t.parsing_report,  # ใช้ debug ได้
+            }
+        )
+
+    return results
+
+
 def extract_tables(
     file_path: str | Path,
     doc_id: str,
     doc_type: str = "generic",
     pages: str = "all",
     flavor_priority: Optional[list[str]] = None,
+    max_workers: Optional[int] = None,
+    page_count: Optional[int] = None,
 ) -> List[TableBlock]:
     """
     ดึงตารางจาก PDF 1 ไฟล์ทั้งหมด
 
+    อ่านทีละหน้าแบบขนานด้วย ProcessPoolExecutor (หน้าละ 1 งาน) แล้วเรียงผลตามลำดับหน้า
+    การลอง flavor สำรองดูทั้งเอกสารเหมือนเดิม: รัน flavor แรกทุกหน้าก่อน
+    ถ้าทั้งเอกสารไม่เจอตารางเลย ค่อยรัน flavor ถัดไปทุกหน้าอีกรอบ
+
     :param file_path: path ไปยัง PDF
     :param doc_id: ไอดีเอกสาร (ใช้เชื่อมกับ DocumentMetadata)
     :param doc_type: ประเภทเอกสาร (เผื่อใช้ logic เพิ่มเติมในอนาคต)
     :param pages: หน้า เช่น "1", "1,2,3", "1-3", "all"
     :param flavor_priority: ลำดับการลอง flavor ของ Camelot เช่น ["lattice", "stream"]
+    :param max_workers: จำนวน process สูงสุด (default: TABLE_WORKERS)
+    :param page_count: จำนวนหน้าของ PDF ถ้ารู้แล้ว (ไม่ส่ง = เปิดไฟล์นับเอง)
+        เรียกจาก thread แยกขณะ thread อื่นใช้ PyMuPDF อยู่ → ควรนับมาให้ก่อน
     :return: list[TableBlock]
     """
     path = Path(file_path)
@@ -85,66 +175,64 @@ def extract_tables(
     if flavor_priority is None:
         flavor_priority = ["lattice", "stream"]
 
+    if page_count is None:
+        with fitz.open(path) as pdf_doc:
+            page_count = pdf_doc.page_count
+    page_numbers = _expand_pages(pages, page_count)
+
+    workers = min(max_workers or TABLE_WORKERS, len(page_numbers))
+    per_page: List[List[dict]] = []
+
+    def _run_flavor(run_map, flavor: str) -> List[List[dict]]:
+        return list(run_map(_extract_one_page, [(str(path), p, flavor) for p in page_numbers]))
+
+    if workers <= 1:
+        # หน้าเดียว / ตั้ง max_workers=1 → ไม่ต้องเสียเวลาสร้าง process
+        for flavor in flavor_priority:
+            per_page = _run_flavor(map, flavor)
+            if any(per_page):
+                break
+    else:
+        # spawn → ไม่ fork process ที่มี thread อื่นกำลังใช้ PyMuPDF / gRPC อยู่ (fork แบบนั้นไม่ปลอดภัย)
+        # pool เดียวใช้ได้ทุก flavor (ไม่ต้อง spawn process ใหม่ตอน fallback)
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as ex:
+            for flavor in flavor_priority:
+                per_page = _run_flavor(ex.map, flavor)
+                # flavor นี้เจอตารางแล้ว (ที่ไหนก็ได้ในเอกสาร) → ใช้ผลนี้เลย ไม่ลอง flavor อื่นต่อ
+                if any(per_page):
+                    break
+
     all_tables: List[TableBlock] = []
     table_index = 0
 
-    # ลองแต่ละ flavor ตามลำดับจนกว่าจะเจอตาราง
-    for flavor in flavor_priority:
-        try:
-            tables = camelot.read_pdf(str(path), pages=pages, flavor=flavor)
-        except Exception as e:
-            # ถ้า flavor นี้ใช้ไม่ได้ (เช่น PDF ไม่มีเส้นตารางสำหรับ lattice) ก็ข้าม
-            print(f"[table_extractor] Error using flavor='{flavor}': {e}")
-            continue
-
-        if tables.n == 0:
-            # ไม่มีตารางใน flavor นี้
-            continue
-
-        # ถ้า flavor นี้เจอตารางแล้ว เราจะใช้ผลของ flavor นี้เลย
-        for t in tables:
-            df: pd.DataFrame = t.df
-
-            # แปลง DataFrame -> columns, rows
-            columns, rows = _dataframe_to_columns_rows(df)
-
-            # เดา category แบบง่าย ๆ
-            category = _guess_table_category(df)
-
-            # พยายามดึง bbox ถ้ามี (บาง version ของ Camelot มี attribute _bbox)
-            bbox: Optional[BBox] = None
-            if hasattr(t, "_bbox") and t._bbox is not None:
-                x1, y1, x2, y2 = t._bbox
-                bbox = (float(x1), float(y1), float(x2), float(y2))
-
+    # ต่อผลทุกหน้าตามลำดับหน้า → table id เรียงต่อกันเหมือนอ่านทีเดียว
+    for page_tables in per_page:
+        for t in page_tables:
             table_index += 1
             table_id = f"tbl_{table_index:04d}"
 
             table_block = TableBlock(
                 id=table_id,
                 doc_id=doc_id,
-                page=t.page,              # page index ที่ Camelot แยกได้
+                page=t["page"],
                 name=f"table_{table_index}",
                 section=None,             # ภายหลังให้ segmenter ใส่
-                category=category,        # เดาจาก header / columns
-                columns=columns,
-                rows=rows,
-                bbox=bbox,
+                category=t["category"],
+                columns=t["columns"],
+                rows=t["rows"],
+                bbox=t["bbox"],
                 extra={
-                    "camelot_flavor": flavor,
-                    "parsing_report": t.parsing_report,  # ใช้ debug ได้
+                    "camelot_flavor": t["flavor"],
+                    "parsing_report": t["parsing_report"],
                     "doc_type": doc_type,
                 },
             )
             all_tables.append(table_block)
 
-        # ถ้า flavor นี้เจอตารางแล้ว เราไม่จำเป็นต้องลอง flavor อื่นต่อ
-        if all_tables:
-            break
-
     return all_tables
 
-
 if __name__ == "__main__":
     import json
     import argparse
@@ -16,6 +16,9 @@ validator.py
 """
 
 from typing import List, Dict, Any
+
+import numpy as np
+
 from .schema import IngestedDocument, TableBlock, ImageBlock, TextBlock
 
 
@@ -94,16 +97,17 @@ def validate_tables(doc: IngestedDocument) -> List[Dict[str, Any]]:
             )
 
         # เช็คความยาว row vs header (อย่างหยาบ ๆ)
-        for r_idx, row in enumerate(rows):
-            if len(row) != len(header):
-                issues.append(
-                    _issue(
-                        "warning",
-                        "ROW_LEN_MISMATCH",
-                        f"Table index={idx} row={r_idx} len(row)={len(row)} != len(header)={len(header)}",
-                        {"table_index": idx, "row_index": r_idx},
-                    )
+        # เก็บความยาวทุกแถวเป็น array แล้วเทียบทีเดียว → วน Python เฉพาะแถวที่ผิด
+        lens = np.fromiter((len(r) for r in rows), dtype=np.int64, count=len(rows))
+        for r_idx in np.flatnonzero(lens != len(header)).tolist():
+            issues.append(
+                _issue(
+                    "warning",
+                    "ROW_LEN_MISMATCH",
+                    f"Table index={idx} row={r_idx} len(row)={lens[r_idx]} != len(header)={len(header)}",
+                    {"table_index": idx, "row_index": r_idx},
                 )
+            )
 
     return issues
 
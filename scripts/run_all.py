@@ -14,11 +14,15 @@ Runner ตัวเดียวสำหรับรันทั้ง pipeline:
     python -m scripts.run_all samples/statement/sample.pdf --doc-id sample --use-gemini
 
 ถ้าไม่ได้ส่ง --doc-id จะใช้ชื่อไฟล์ (ไม่รวม .pdf) เป็น doc_id ให้
+
+แต่ละขั้นยังเซฟ JSON ของตัวเองตามเดิม แต่ส่ง IngestedDocument ต่อกันในหน่วยความจำ
+→ ขั้นถัดไปไม่ต้องอ่าน / parse JSON ของขั้นก่อนกลับขึ้นมาใหม่
 """
 
 import argparse
 from pathlib import Path
 
+from ingestion.config import setup_logging
 from scripts.run_ingestion import run_ingestion_pipeline
 from scripts.run_cleaning import run_cleaning
 from scripts.run_semantic_enrich import run_semantic_enrich
@@ -36,7 +40,7 @@ def run_all(
         doc_id = pdf_path.stem
 
     print("==== [1/3] Ingestion ====")
-    run_ingestion_pipeline(
+    doc = run_ingestion_pipeline(
         pdf_path=pdf_path,
         doc_type=doc_type,
         doc_id=doc_id,
@@ -44,9 +48,10 @@ def run_all(
     )
 
     print("\n==== [2/3] Cleaning ====")
-    run_cleaning(
+    doc = run_cleaning(
         doc_id=doc_id,
         output_root=output_root,
+        doc=doc,
     )
 
     print("\n==== [3/3] Semantic Enrich ====")
@@ -54,6 +59,7 @@ def run_all(
         doc_id=doc_id,
         output_root=output_root,
         use_gemini=use_gemini,
+        doc=doc,
     )
 
     print("\n✅ Done: full pipeline finished.")
@@ -82,9 +88,10 @@ def main() -> None:
     parser.add_argument(
         "--use-gemini",
         action="store_true",
-        help="Enable Gemini for section/text role tagging (if GOOGLE_API_KEY is set)",
+        help="Enable Gemini for section/text role tagging (if GEMINI_API_KEY is set)",
     )
     args = parser.parse_args()
+    setup_logging()
 
     run_all(
         pdf_path=args.pdf_path,
@@ -5,6 +5,7 @@ run_cleaning.py
 
 ใช้ทำ Data Cleaning หลังจาก ingestion เสร็จ:
 - อ่าน ingested/{doc_id}/metadata.json, text.json, table.json
+  (หรือรับ IngestedDocument ที่อยู่ในหน่วยความจำมาเลย เช่นจาก run_all)
 - รัน cleaner.clean_text_blocks / clean_table_blocks
 - เซฟเป็น text_clean.json, table_clean.json
 """
@@ -12,18 +13,15 @@ run_cleaning.py
 import argparse
 import json
 from pathlib import Path
+from typing import Optional
 
+from ingestion.config import setup_logging
 from ingestion.schema import DocumentMetadata, TextBlock, TableBlock, IngestedDocument
 from ingestion.cleaner import clean_text_blocks, clean_table_blocks
 
 
-def run_cleaning(
-    doc_id: str,
-    output_root: str | Path = "ingested",
-) -> None:
-    output_root = Path(output_root)
-    doc_dir = output_root / doc_id
-
+def _load_ingested_document(doc_dir: Path, doc_id: str) -> IngestedDocument:
+    """โหลด metadata.json + text.json + table.json ที่ ingestion เซฟไว้กลับเป็น IngestedDocument"""
     meta_path = doc_dir / "metadata.json"
     text_path = doc_dir / "text.json"
     table_path = doc_dir / "table.json"
@@ -45,13 +43,33 @@ def run_cleaning(
     else:
         tables = []
 
-    doc = IngestedDocument(
+    return IngestedDocument(
         metadata=meta,
         texts=texts,
         tables=tables,
         images=[],
     )
 
+
+def run_cleaning(
+    doc_id: str,
+    output_root: str | Path = "ingested",
+    doc: Optional[IngestedDocument] = None,
+) -> IngestedDocument:
+    """
+    ทำความสะอาด text / table ของเอกสาร แล้วเซฟ text_clean.json / table_clean.json
+
+    doc: ถ้าส่งมา (เช่นผลของ run_ingestion_pipeline ใน run_all) ใช้ตัวนี้เลย ไม่ต้องอ่าน JSON กลับ
+    :return: IngestedDocument ที่ texts / tables ผ่านการทำความสะอาดแล้ว
+    """
+    output_root = Path(output_root)
+    doc_dir = output_root / doc_id
+
+    if doc is None:
+        doc = _load_ingested_document(doc_dir, doc_id)
+    else:
+        doc_dir.mkdir(parents=True, exist_ok=True)
+
     print(f"[run_cleaning] Cleaning texts for doc_id={doc_id} ...")
     cleaned_texts = clean_text_blocks(doc.texts)
 
@@ -84,6 +102,13 @@ def run_cleaning(
         f"Cleaned Tables={len(cleaned_tables)}"
     )
 
+    return IngestedDocument(
+        metadata=doc.metadata,
+        texts=cleaned_texts,
+        tables=cleaned_tables,
+        images=doc.images,
+    )
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Run data cleaning for ingested document.")
@@ -98,6 +123,7 @@ def main() -> None:
         help="Root folder ของผล ingestion (default: 'ingested')",
     )
     args = parser.parse_args()
+    setup_logging()
 
     run_cleaning(doc_id=args.doc_id, output_root=args.output_root)
 
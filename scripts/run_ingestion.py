@@ -1,18 +1,16 @@
 from __future__ import annotations
 from ingestion.validator import validate_all
-from ingestion.ocr_extractor import ocr_extract_document
 
 
 """
 run_ingestion.py
 
 สคริปต์หลักสำหรับรัน ingestion เต็ม pipeline:
-1) อ่าน PDF ด้วย pdf_parser.parse_pdf -> ได้ metadata + text blocks
+1) อ่าน PDF ด้วย pipeline.ingest_pdf (เปิดไฟล์ครั้งเดียว) -> ได้ metadata + text blocks + รูป
 2) ให้ AI (Gemini) ช่วยเดาประเภทเอกสาร (bank_statement / invoice / receipt / ...)
 3) ดึงตารางด้วย table_extractor.extract_tables -> TableBlock list
-4) ดึงรูปด้วย image_extractor.extract_images -> ImageBlock list
-5) รวมทั้งหมดเข้า IngestedDocument
-6) เซฟออกเป็น JSON แยกไฟล์ในโฟลเดอร์ ingested/{doc_id}/
+4) รวมทั้งหมดเข้า IngestedDocument
+5) เซฟออกเป็น JSON แยกไฟล์ในโฟลเดอร์ ingested/{doc_id}/
 
 วิธีรันตัวอย่าง:
 
@@ -21,16 +19,29 @@ run_ingestion.py
 """
 
 import argparse
-import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from ingestion.pdf_parser import parse_pdf
+import fitz  # PyMuPDF (ใช้นับจำนวนหน้า)
+import orjson
+
+from ingestion.config import setup_logging
+from ingestion.pipeline import ingest_pdf
 from ingestion.table_extractor import extract_tables
-from ingestion.image_extractor import extract_images
 from ingestion.schema import IngestedDocument
 from ingestion.document_classifier import classify_document
 
 
+def _write_json(path: Path, obj) -> None:
+    """
+    เขียน obj เป็น JSON (indent 2, ไม่ escape ภาษาไทย) ด้วย orjson → เร็วกว่า json.dump มาก
+    ค่าที่ orjson ไม่รู้จักจะถูกแปลงเป็น str
+    """
+    path.write_bytes(
+        orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    )
+
+
 def save_ingested_document(
     doc: IngestedDocument,
     output_root: str | Path = "ingested",
@@ -51,38 +62,19 @@ def save_ingested_document(
 
     # 1) metadata.json
     metadata_path = doc_dir / "metadata.json"
-    with metadata_path.open("w", encoding="utf-8") as f:
-        json.dump(doc.metadata.to_dict(), f, ensure_ascii=False, indent=2)
+    _write_json(metadata_path, doc.metadata.to_dict())
 
     # 2) text.json
     text_path = doc_dir / "text.json"
-    with text_path.open("w", encoding="utf-8") as f:
-        json.dump(
-            [t.to_dict() for t in doc.texts],
-            f,
-            ensure_ascii=False,
-            indent=2,
-        )
+    _write_json(text_path, [t.to_dict() for t in doc.texts])
 
     # 3) table.json
     table_path = doc_dir / "table.json"
-    with table_path.open("w", encoding="utf-8") as f:
-        json.dump(
-            [tb.to_dict() for tb in doc.tables],
-            f,
-            ensure_ascii=False,
-            indent=2,
-        )
+    _write_json(table_path, [tb.to_dict() for tb in doc.tables])
 
     # 4) image.json
     image_path = doc_dir / "image.json"
-    with image_path.open("w", encoding="utf-8") as f:
-        json.dump(
-            [im.to_dict() for im in doc.images],
-            f,
-            ensure_ascii=False,
-            indent=2,
-        )
+    _write_json(image_path, [im.to_dict() for im in doc.images])
 
     print(f"[run_ingestion] Saved metadata to: {metadata_path}")
     print(f"[run_ingestion] Saved texts to:    {text_path}")
@@ -99,10 +91,9 @@ def run_ingestion_pipeline(
     """
     รัน ingestion ครบชุดสำหรับ PDF 1 ไฟล์:
 
-    - parse_pdf -> metadata + texts
+    - extract_tables -> tables (เริ่มทันทีใน thread แยก ทำไปพร้อมกับสองข้อล่าง)
+    - ingest_pdf -> metadata + texts + images (อ่าน PDF รอบเดียว)
     - ใช้ Gemini ช่วย classify ประเภทเอกสาร
-    - extract_tables -> tables
-    - extract_images -> images
     - รวมทั้งหมดกลับเข้า IngestedDocument
     - เซฟ JSON ลงโฟลเดอร์
 
@@ -110,46 +101,52 @@ def run_ingestion_pipeline(
     """
     pdf_path = Path(pdf_path)
 
-    # 1) parse PDF เพื่อให้ได้ metadata + texts
-    print(f"[run_ingestion] Parsing PDF text from: {pdf_path}")
-    doc = parse_pdf(
-        file_path=pdf_path,
-        doc_type=doc_type,  # initial hint เผื่ออยากส่ง
-        doc_id=doc_id,
-        source="uploaded",
-    )
+    # doc_id ที่ใช้จริง (ถ้าไม่ระบุ = ชื่อไฟล์ไม่รวมนามสกุล เหมือนใน ingest_pdf)
+    effective_doc_id = doc_id or pdf_path.stem
+
+    # นับหน้าใน thread นี้ก่อน → thread ของ extract_tables ไม่ต้องแตะ PyMuPDF
+    # (PyMuPDF ใช้พร้อมกันหลาย thread ไม่ได้ และ thread นี้กำลังจะ ingest_pdf)
+    with fitz.open(pdf_path) as pdf_doc:
+        page_count = pdf_doc.page_count
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # 1) extract tables → ไม่ขึ้นกับ text / ประเภทเอกสาร เริ่มได้เลย
+        #    (Camelot แยก process อยู่แล้ว thread นี้แค่รอผล)
+        print(f"[run_ingestion] Extracting tables for doc_id={effective_doc_id}")
+        tables_future = pool.submit(
+            extract_tables,
+            file_path=pdf_path,
+            doc_id=effective_doc_id,
+            doc_type=doc_type,
+            pages="all",
+            page_count=page_count,
+        )
+
+        # 2) parse PDF เพื่อให้ได้ metadata + texts + images ในรอบเดียว
+        print(f"[run_ingestion] Parsing PDF text + images from: {pdf_path}")
+        doc = ingest_pdf(
+            file_path=pdf_path,
+            doc_type=doc_type,  # initial hint เผื่ออยากส่ง
+            doc_id=effective_doc_id,
+            source="uploaded",
+            output_root=output_root,
+        )
+
+        # 3) ให้ Gemini ช่วยฟันธงประเภทเอกสาร
+        try:
+            predicted_type = classify_document(doc, use_gemini=True)
+            print(f"[run_ingestion] Predicted document type: {predicted_type}")
+            doc.metadata.doc_type = predicted_type
+        except Exception as e:
+            print(f"[run_ingestion] Document classification failed: {e}")
+            print("[run_ingestion] Keep original doc_type:", doc.metadata.doc_type)
+
+        doc.tables = tables_future.result()
+
+    # ตารางเริ่มก่อนรู้ประเภทเอกสาร → อัปเดต doc_type ใน extra ให้ตรงกับผล classify
+    for tb in doc.tables:
+        tb.extra["doc_type"] = doc.metadata.doc_type
 
-    # doc_id ที่ใช้จริง (มาจาก metadata เสมอ)
-    effective_doc_id = doc.metadata.doc_id
-
-    # 2) ให้ Gemini ช่วยฟันธงประเภทเอกสาร
-    try:
-        predicted_type = classify_document(doc, use_gemini=True)
-        print(f"[run_ingestion] Predicted document type: {predicted_type}")
-        doc.metadata.doc_type = predicted_type
-    except Exception as e:
-        print(f"[run_ingestion] Document classification failed: {e}")
-        print("[run_ingestion] Keep original doc_type:", doc.metadata.doc_type)
-
-    # 3) extract tables
-    print(f"[run_ingestion] Extracting tables for doc_id={effective_doc_id}")
-    tables = extract_tables(
-        file_path=pdf_path,
-        doc_id=effective_doc_id,
-        doc_type=doc.metadata.doc_type,
-        pages="all",
-    )
-    doc.tables = tables
-
-    # 4) extract images
-    print(f"[run_ingestion] Extracting images for doc_id={effective_doc_id}")
-    images = extract_images(
-        file_path=pdf_path,
-        doc_id=effective_doc_id,
-        output_root=output_root,
-    )
-    doc.images = images
-    
     # 4) run validation
     print(f"[run_ingestion] Validating document for doc_id={effective_doc_id}")
     issues = validate_all(doc)
@@ -160,8 +157,7 @@ def run_ingestion_pipeline(
     doc_dir.mkdir(parents=True, exist_ok=True)
     validation_path = doc_dir / "validation.json"
 
-    with validation_path.open("w", encoding="utf-8") as f:
-        json.dump(issues, f, ensure_ascii=False, indent=2)
+    _write_json(validation_path, issues)
 
     print(f"[run_ingestion] Validation issues: {len(issues)} (saved to {validation_path})")
 
@@ -195,6 +191,7 @@ def main() -> None:
         help="Root folder to save ingested outputs (default: 'ingested')",
     )
     args = parser.parse_args()
+    setup_logging()
 
     run_ingestion_pipeline(
         pdf_path=args.pdf_path,
@@ -4,8 +4,8 @@ from __future__ import annotations
 run_semantic_enrich.py
 
 ขั้นตอนหลัง ingestion + cleaning:
-1) โหลด metadata + text_clean + table_clean
-2) ใส่ section label ให้ text (tag_sections)
+1) โหลด metadata + text_clean + table_clean (หรือรับ IngestedDocument ที่ clean แล้วจาก run_all)
+2) ใส่ section + role label ให้ text (tag_sections_and_roles, Gemini call เดียว)
 3) normalize header ของ table (normalize_tables)
 4) extract transaction records (prepare_mapping_payload)
 5) เซฟออกเป็น:
@@ -17,23 +17,19 @@ run_semantic_enrich.py
 import argparse
 import json
 from pathlib import Path
+from typing import Optional
 
+from ingestion.config import setup_logging
 from ingestion.schema import DocumentMetadata, TextBlock, TableBlock, IngestedDocument
 from ingestion.semantic_enricher import (
-    tag_sections,
+    tag_sections_and_roles,
     normalize_tables,
     prepare_mapping_payload,
 )
 
 
-def run_semantic_enrich(
-    doc_id: str,
-    output_root: str | Path = "ingested",
-    use_gemini: bool = False,
-) -> None:
-    output_root = Path(output_root)
-    doc_dir = output_root / doc_id
-
+def _load_cleaned_document(doc_dir: Path, doc_id: str) -> IngestedDocument:
+    """โหลด metadata.json + text_clean.json + table_clean.json ที่ run_cleaning เซฟไว้"""
     meta_path = doc_dir / "metadata.json"
     text_clean_path = doc_dir / "text_clean.json"
     table_clean_path = doc_dir / "table_clean.json"
@@ -54,16 +50,37 @@ def run_semantic_enrich(
     else:
         tables = []
 
-    doc = IngestedDocument(
+    return IngestedDocument(
         metadata=meta,
         texts=texts,
         tables=tables,
         images=[],
     )
 
-    # 1) tag sections in text
-    print(f"[run_semantic_enrich] Tagging sections (use_gemini={use_gemini}) ...")
-    doc = tag_sections(doc, use_gemini=use_gemini)
+
+def run_semantic_enrich(
+    doc_id: str,
+    output_root: str | Path = "ingested",
+    use_gemini: bool = False,
+    doc: Optional[IngestedDocument] = None,
+) -> IngestedDocument:
+    """
+    ใส่ section / role, normalize ตาราง, เตรียม mapping แล้วเซฟผลลงโฟลเดอร์ของเอกสาร
+
+    doc: ถ้าส่งมา (เช่นผลของ run_cleaning ใน run_all) ใช้ตัวนี้เลย ไม่ต้องอ่าน JSON กลับ
+    :return: IngestedDocument ที่ enrich แล้ว
+    """
+    output_root = Path(output_root)
+    doc_dir = output_root / doc_id
+
+    if doc is None:
+        doc = _load_cleaned_document(doc_dir, doc_id)
+    else:
+        doc_dir.mkdir(parents=True, exist_ok=True)
+
+    # 1) tag sections + text roles in text
+    print(f"[run_semantic_enrich] Tagging sections + roles (use_gemini={use_gemini}) ...")
+    doc = tag_sections_and_roles(doc, use_gemini=use_gemini)
 
     # 2) normalize tables
     print("[run_semantic_enrich] Normalizing tables ...")
@@ -106,6 +123,8 @@ def run_semantic_enrich(
     print(f"[run_semantic_enrich] Saved table_normalized to: {table_normalized_path}")
     print(f"[run_semantic_enrich] Saved mapping to:          {mapping_path}")
 
+    return doc
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Run semantic enrichment pipeline (section + normalize + mapping).")
@@ -125,6 +144,7 @@ def main() -> None:
         help="ถ้าระบุ flag นี้ จะให้ Gemini ช่วย tag section",
     )
     args = parser.parse_args()
+    setup_logging()
 
     run_semantic_enrich(
         doc_id=args.doc_id,